@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Test corpus helpers shared by       #
+# the benchmark scripts               #
+#######################################
+
+"""
+Finding programs of the test corpus, their translation to XML and the check of their results against
+.rc and .out files - shared by corpus_runner.py, e2e_bench.py and dispatch_bench.py, so that all of them
+agree on which programs exist and what a correct result is.
+"""
+
+import os
+import re
+import subprocess
+
+
+def find_sources(dirs):
+    """
+    :return: sorted list of all .src files in given directories (recursively)
+    """
+    sources = []
+    for directory in dirs:
+        for dir_path, _, file_names in os.walk(directory):
+            sources.extend(os.path.join(dir_path, f) for f in file_names if f.endswith(".src"))
+    return sorted(sources)
+
+
+def to_xml(src, php, parse_script):
+    """
+    returns XML representation of a program - .src files in both/ contain IPPcode22 source code,
+    which is translated by parse.php (same as test.php does), other files already contain XML
+
+    :return: XML as bytes or None if the program could not be translated
+    """
+    with open(src, "rb") as f:
+        content = f.read()
+    if content.lstrip().startswith(b"<"):
+        return content
+    if php is None:
+        return None
+    result = subprocess.run([php, parse_script], input=content, capture_output=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def read_expected(src):
+    """
+    :return: (expected return code, expected output as bytes) of a program - a missing .rc file means
+     return code 0 and a missing .out file empty output (same as test.php)
+    """
+    base = src[:-len(".src")]
+    rc = 0
+    output = b""
+    if os.path.exists(base + ".rc"):
+        with open(base + ".rc", encoding="utf-8") as f:
+            rc = int(f.read().strip() or 0)
+    if os.path.exists(base + ".out"):
+        with open(base + ".out", "rb") as f:
+            output = f.read()
+    return rc, output
+
+
+def normalize_output(output):
+    """
+    :return: output with amounts of white space ignored (same as "diff -b")
+    """
+    lines = output.split(b"\n")
+    return [re.sub(rb"[ \t\r\f\v]+", b" ", line).rstrip() for line in lines]
+
+
+def is_correct(rc, output, expected):
+    """
+    checks the result of a program the same way as test.php does - the return code has to match,
+    the output is compared (ignoring amounts of white space) only when the expected return code is 0
+
+    :param expected: (expected return code, expected output) of the program (see read_expected)
+    """
+    expected_rc, expected_output = expected
+    if rc != expected_rc:
+        return False
+    return expected_rc != 0 or normalize_output(output) == normalize_output(expected_output)
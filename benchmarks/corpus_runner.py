@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Parallel test corpus runner for     #
+# interpret.py                        #
+#######################################
+
+"""
+Runs interpret.py on the test corpus (by default both/interpret-only and both/both) the same way as test.php
+does, but in a pool of processes sized to the number of CPU cores. Every .src file is a test - its .in file
+is the input of the program (empty if missing), the return code is compared with its .rc file (0 if missing)
+and when the expected return code is 0, the output is compared with its .out file (empty if missing),
+amounts of white space are ignored as by "diff -b". IPPcode22 sources (both/both) are translated
+by parse.php, if PHP is available, otherwise they are reported as skipped.
+
+Tests can be filtered by directories given as arguments or by a pattern of their path:
+
+    python3 benchmarks/corpus_runner.py both/interpret-only/frames
+    python3 benchmarks/corpus_runner.py --filter='*/stack_tests/*' --json=/tmp/results.json
+
+The JSON summary contains the result, return codes, hash of the output and run time of every test.
+A summary of an earlier run can be given as --baseline - tests whose return code or output differ from it
+are reported as changed, which is useful for tests without .rc and .out files:
+
+    python3 benchmarks/corpus_runner.py --json=/tmp/before.json
+    (change interpret.py)
+    python3 benchmarks/corpus_runner.py --baseline=/tmp/before.json
+
+The script exits with 1 if any test failed (or changed, when --baseline is given).
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from corpus import find_sources, is_correct, read_expected, to_xml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIRS = [os.path.join(REPO_DIR, "both", "interpret-only"), os.path.join(REPO_DIR, "both", "both")]
+
+
+def run_test(job):
+    """
+    runs one test in a separate process of the interpreter, the program is given on standard input
+
+    :param job: (path of the .src file, interpreter, PHP executable, parse.php, timeout in seconds)
+    :return: dictionary with the result of the test
+    """
+    src, interpreter, php, parse_script, timeout = job
+    xml = to_xml(src, php, parse_script)
+    if xml is None:
+        return {"test": src, "result": "skipped", "time": 0.0}
+    input_path = src[:-len(".src")] + ".in"
+    if not os.path.exists(input_path):
+        input_path = os.devnull
+    expected = read_expected(src)
+    expected_rc = expected[0]
+
+    start = time.perf_counter()
+    try:
+        process = subprocess.run([sys.executable, interpreter, "--input=" + input_path],
+                                 input=xml, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"test": src, "result": "timeout", "time": time.perf_counter() - start,
+                "expected_rc": expected_rc}
+    elapsed = time.perf_counter() - start
+
+    passed = is_correct(process.returncode, process.stdout, expected)
+    return {
+        "test": src,
+        "result": "passed" if passed else "failed",
+        "time": elapsed,
+        "rc": process.returncode,
+        "expected_rc": expected_rc,
+        "output": hashlib.sha256(process.stdout).hexdigest(),
+    }
+
+
+def compare(results, baseline):
+    """
+    compares results with a summary of an earlier run
+
+    :return: list of tests whose return code or output changed
+    """
+    before = {result["test"]: result for result in baseline["tests"]}
+    changed = []
+    for result in results:
+        old = before.get(result["test"])
+        if old is None or result["result"] == "skipped" or old["result"] == "skipped":
+            continue
+        if (result.get("rc"), result.get("output")) != (old.get("rc"), old.get("output")):
+            changed.append(result["test"])
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="runs the test corpus of interpret.py in parallel")
+    parser.add_argument("dirs", nargs="*", default=DEFAULT_DIRS,
+                        help="directories with tests (default: both/interpret-only and both/both)")
+    parser.add_argument("--filter", metavar="PATTERN",
+                        help="run only tests whose path (relative to the repository) matches the shell pattern")
+    parser.add_argument("--interpreter", default=os.path.join(REPO_DIR, "interpret.py"),
+                        help="interpreter to test (default: interpret.py)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of tests run at once (default: number of CPU cores)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="time limit of one test in seconds (default: 10)")
+    parser.add_argument("--json", metavar="FILE", help="write the summary of all tests as JSON into the file")
+    parser.add_argument("--baseline", metavar="FILE", help="report tests which changed since an earlier summary")
+    parser.add_argument("--php", default=shutil.which("php8.1") or shutil.which("php"),
+                        help="PHP executable used to run parse.php on IPPcode22 sources")
+    parser.add_argument("--parse-script", default=os.path.join(REPO_DIR, "parse.php"))
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    sources = find_sources(args.dirs)
+    if args.filter is not None:
+        sources = [src for src in sources if fnmatch.fnmatch(os.path.relpath(src, REPO_DIR), args.filter)]
+    jobs = [(src, args.interpreter, args.php, args.parse_script, args.timeout) for src in sources]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(max(args.jobs, 1)) as pool:
+        results = sorted(pool.imap_unordered(run_test, jobs, chunksize=4), key=lambda result: result["test"])
+    elapsed = time.perf_counter() - start
+
+    counts = {"passed": 0, "failed": 0, "timeout": 0, "skipped": 0}
+    for result in results:
+        result["test"] = os.path.relpath(result["test"], REPO_DIR)
+        counts[result["result"]] += 1
+        if result["result"] == "failed":
+            print("FAILED {0}: return code {1}, expected {2}".format(result["test"], result["rc"],
+                                                                     result["expected_rc"]))
+        elif result["result"] == "timeout":
+            print("TIMEOUT {0}".format(result["test"]))
+    print("{0} tests in {1:.1f} s: {2} passed, {3} failed, {4} timed out, {5} skipped".format(
+        len(results), elapsed, counts["passed"], counts["failed"], counts["timeout"], counts["skipped"]))
+
+    changed = []
+    if baseline is not None:
+        changed = compare(results, baseline)
+        for test in changed:
+            print("CHANGED {0}".format(test))
+        print("{0} tests changed since the baseline".format(len(changed)))
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"interpreter": args.interpreter, "time": elapsed, "counts": counts, "tests": results},
+                      f, indent=2)
+    if counts["failed"] or counts["timeout"] or changed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Dispatch microbenchmark for         #
+# interpret.py                        #
+#######################################
+
+"""
+Measures how many instructions per second the evaluator loop of interpret.py executes
+on the test corpus (by default the both/ directory). Only the evaluation is timed - programs
+are loaded and checked beforehand, and every program is repeated until it runs for at least
+--min-time seconds. Programs which do not finish successfully (EXIT, runtime error) in any of the measured
+interpreters are skipped, so that all interpreters are measured on the same programs.
+
+Several interpreters can be compared by repeating --interpreter, e.g. a copy of interpret.py
+from an older commit:
+
+    git show HEAD~1:interpret.py > /tmp/interpret_before.py
+    python3 benchmarks/dispatch_bench.py --interpreter=/tmp/interpret_before.py --interpreter=interpret.py
+
+With --compile the programs are evaluated by compiled basic blocks (interpret.py --compile).
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import sys
+import time
+import xml.etree.ElementTree as Xml
+
+from corpus import find_sources, to_xml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# globals of the interpreter which describe the loaded program (labels, variable slots)
+PROGRAM_TABLES = ("LD", "GVS", "LVS")
+
+
+class CountingProgram(list):
+    """
+    list of instructions which counts how many of them the evaluator fetched - used for older interpreters
+    whose eval_instructions() does not return the number of executed instructions
+    """
+
+    def __init__(self, program):
+        super().__init__(program)
+        self.fetched = 0
+
+    def __getitem__(self, index):
+        self.fetched += 1
+        return list.__getitem__(self, index)
+
+
+def load_interpreter(path, index):
+    """
+    imports interpret.py (or its older copy) from given path as a separate module - older interpreters
+    without the __main__ guard run right on import, so they are imported with --help as their only
+    argument and the exit after printing the help is ignored
+    """
+    spec = importlib.util.spec_from_file_location("interpret_bench_{0}".format(index), path)
+    module = importlib.util.module_from_spec(spec)
+    argv = sys.argv
+    sys.argv = [path, "--help"]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = argv
+    return module
+
+
+def reset_interpreter(interp):
+    """
+    resets frames and stacks of the interpreter (older interpreters have no reset_state())
+    """
+    if hasattr(interp, "reset_state"):
+        interp.reset_state()
+        return
+    interp.GF = {}
+    interp.LF = None
+    interp.TF = None
+    interp.FS = []
+    interp.CS = []
+    interp.DS = []
+
+
+def load_program(interp, xml):
+    """
+    loads and checks program the same way as interpret.run() does
+    (older interpreters without load_program() build the whole XML tree first,
+    the oldest ones without decode_program() evaluate the XML tree itself)
+
+    :return: list of decoded instructions
+    """
+    reset_interpreter(interp)
+    if hasattr(interp, "load_program"):
+        return interp.load_program(io.BytesIO(xml))
+    interp.LD = {}
+    root = interp.sort_root(Xml.fromstring(xml))
+    interp.semantics_check(root)
+    interp.fill_label_dict_with_labels(root)
+    interp.check_root_attrib(root)
+    interp.check_instr_xml(root)
+    if hasattr(interp, "decode_program"):
+        return interp.decode_program(root)
+    return list(root)
+
+
+def program_tables(interp):
+    """
+    :return: labels and variable slots of the program loaded last (see PROGRAM_TABLES)
+    """
+    return {name: getattr(interp, name) for name in PROGRAM_TABLES if hasattr(interp, name)}
+
+
+def run_program(interp, program, input_text, compiled=False, tables=None):
+    """
+    evaluates loaded program once with its output discarded
+
+    :param compiled: if True, the program is evaluated by compiled basic blocks (if the interpreter has them)
+    :param tables: labels and variable slots of the program (see program_tables), by default
+     the ones of the program loaded last
+    :return: number of executed instructions (None if the interpreter does not report it)
+    """
+    # labels and variable slots belong to the loaded program, reset_state() would throw them away
+    if tables is None:
+        tables = program_tables(interp)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        reset_interpreter(interp)
+        for name, table in tables.items():
+            setattr(interp, name, table)
+        if hasattr(interp, "COMPILE"):
+            interp.COMPILE = compiled
+        return interp.eval_instructions(program, io.StringIO(input_text))
+
+
+def prepare_programs(interp, programs, compiled=False):
+    """
+    loads every program and evaluates it once
+
+    :param programs: list of (XML, input text) of programs
+    :return: list with (loaded program, its tables, number of executed instructions) for every program,
+     None for programs which the interpreter does not complete (error, EXIT)
+    """
+    prepared = []
+    for xml, input_text in programs:
+        try:
+            program = load_program(interp, xml)
+            tables = program_tables(interp)
+            per_run = run_program(interp, program, input_text, compiled, tables)
+            if per_run is None:
+                counting = CountingProgram(program)
+                run_program(interp, counting, input_text, compiled, tables)
+                per_run = counting.fetched
+        except (Exception, SystemExit):
+            prepared.append(None)
+            continue
+        prepared.append((program, tables, per_run))
+    return prepared
+
+
+def bench_interpreter(interp, runs, min_time, compiled=False):
+    """
+    :param runs: list of (loaded program, its tables, number of executed instructions, input text)
+    :return: (number of executed instructions, evaluation time in seconds)
+    """
+    total_instr = 0
+    total_time = 0.0
+    for program, tables, per_run, input_text in runs:
+        executed = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            run_program(interp, program, input_text, compiled, tables)
+            executed += per_run
+            elapsed = time.perf_counter() - start
+        total_instr += executed
+        total_time += elapsed
+    return total_instr, total_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="instructions per second of interpret.py evaluator loop")
+    parser.add_argument("dirs", nargs="*", default=[os.path.join(REPO_DIR, "both")],
+                        help="directories with test programs (default: both/)")
+    parser.add_argument("--interpreter", action="append",
+                        help="interpreter to measure, can be repeated (default: interpret.py)")
+    parser.add_argument("--min-time", type=float, default=0.02,
+                        help="minimal evaluation time of every program in seconds (default: 0.02)")
+    parser.add_argument("--compile", action="store_true",
+                        help="evaluate programs by compiled basic blocks (interpret.py --compile)")
+    parser.add_argument("--php", default=shutil.which("php8.1") or shutil.which("php"),
+                        help="PHP executable used to run parse.php on IPPcode22 sources")
+    parser.add_argument("--parse-script", default=os.path.join(REPO_DIR, "parse.php"))
+    args = parser.parse_args()
+
+    interpreters = args.interpreter or [os.path.join(REPO_DIR, "interpret.py")]
+    programs = []
+    skipped = 0
+    for src in find_sources(args.dirs):
+        xml = to_xml(src, args.php, args.parse_script)
+        if xml is None:
+            skipped += 1
+            continue
+        input_path = src[:-len(".src")] + ".in"
+        input_text = ""
+        if os.path.exists(input_path):
+            with open(input_path, encoding="utf-8") as f:
+                input_text = f.read()
+        programs.append((xml, input_text))
+    if skipped:
+        print("skipped {0} sources which could not be translated to XML".format(skipped), file=sys.stderr)
+
+    # only programs which all interpreters complete are measured, so that all of them run the same workload
+    interps = [load_interpreter(path, index) for index, path in enumerate(interpreters)]
+    prepared = [prepare_programs(interp, programs, args.compile) for interp in interps]
+    common = [i for i in range(len(programs)) if all(loaded[i] is not None for loaded in prepared)]
+    print("measuring {0} of {1} programs, which all interpreters complete".format(len(common), len(programs)))
+
+    for path, interp, loaded in zip(interpreters, interps, prepared):
+        runs = [loaded[i] + (programs[i][1],) for i in common]
+        instr_count, elapsed = bench_interpreter(interp, runs, args.min_time, args.compile)
+        ips = instr_count / elapsed if elapsed else 0.0
+        print("{0}: {1} instructions in {2:.3f} s, {3:,.0f} instructions/s".format(path, instr_count, elapsed, ips))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# End-to-end benchmark for            #
+# interpret.py                        #
+#######################################
+
+"""
+Runs interpret.py on benchmark programs as separate processes (the same way as test.php does) and reports
+wall time, peak memory (maximum resident set size) and instructions per second of every program.
+By default the CPU-heavy programs in benchmarks/programs are measured (loops, recursion, string building,
+stack traffic, reading of input), corpus directories can be given instead, e.g. both/interpret-only.
+IPPcode22 sources (.src files in both/both) are translated by parse.php, if PHP is available.
+
+The number of executed instructions is taken from one more run with --profile=file - all executed instructions
+are counted (also LABEL, DPRINT and BREAK, which the statistic --insts leaves out), the same way as
+benchmarks/dispatch_bench.py counts them. The return code and output of every program are checked against
+its .rc and .out files the same way as test.php and benchmarks/corpus_runner.py check them (see is_correct
+in benchmarks/corpus.py) - a program which gives a wrong result is reported and left out of the comparison.
+
+Results can be saved as a baseline and compared with it later, programs which got slower
+by more than --threshold are reported as regressions (and the script exits with 1):
+
+    python3 benchmarks/e2e_bench.py --save=/tmp/baseline.json
+    (change interpret.py)
+    python3 benchmarks/e2e_bench.py --baseline=/tmp/baseline.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus import find_sources, is_correct, read_expected, to_xml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAMS_DIR = os.path.join(REPO_DIR, "benchmarks", "programs")
+
+
+def run_interpreter(interpreter, xml_path, input_path, extra_args=()):
+    """
+    runs the interpreter on a program in a separate process
+
+    :return: (return code, standard output, wall time in seconds, maximum resident set size in MB)
+    """
+    args = [sys.executable, interpreter, "--source=" + xml_path, "--input=" + input_path] + list(extra_args)
+    with tempfile.TemporaryFile() as out:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        out.seek(0)
+        output = out.read()
+    return os.waitstatus_to_exitcode(status), output, elapsed, usage.ru_maxrss / 1024
+
+
+def count_instructions(interpreter, xml_path, input_path, tmp_dir):
+    """
+    :return: number of all executed instructions (from the profile, see --profile) or None
+     if the interpreter did not write the profile (older interpreter)
+    """
+    profile_path = os.path.join(tmp_dir, "profile.json")
+    if os.path.exists(profile_path):
+        os.remove(profile_path)
+    run_interpreter(interpreter, xml_path, input_path, ["--profile=" + profile_path])
+    try:
+        with open(profile_path, encoding="utf-8") as f:
+            return json.load(f)["executed_instructions"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def bench_program(interpreter, src, xml, tmp_dir, repeat):
+    """
+    measures one program
+
+    :return: dictionary with results of the program
+    """
+    xml_path = os.path.join(tmp_dir, "program.xml")
+    with open(xml_path, "wb") as f:
+        f.write(xml)
+    input_path = src[:-len(".src")] + ".in"
+    if not os.path.exists(input_path):
+        input_path = os.devnull
+
+    runs = [run_interpreter(interpreter, xml_path, input_path) for _ in range(repeat)]
+    rc, output = runs[0][0], runs[0][1]
+    ok = is_correct(rc, output, read_expected(src))
+    elapsed = min(run[2] for run in runs)
+    instructions = count_instructions(interpreter, xml_path, input_path, tmp_dir)
+    return {
+        "rc": rc,
+        "ok": ok,
+        "time": elapsed,
+        "max_rss": max(run[3] for run in runs),
+        "instructions": instructions,
+        "ips": instructions / elapsed if instructions else None,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    compares results with the baseline
+
+    :return: list of (program, baseline time, time) of programs slower by more than threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or not result["ok"] or not base["ok"]:
+            continue
+        if result["time"] > base["time"] * (1 + threshold):
+            regressions.append((name, base["time"], result["time"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end benchmark of interpret.py")
+    parser.add_argument("dirs", nargs="*", default=[PROGRAMS_DIR],
+                        help="directories with benchmark programs (default: benchmarks/programs)")
+    parser.add_argument("--interpreter", default=os.path.join(REPO_DIR, "interpret.py"),
+                        help="interpreter to measure (default: interpret.py)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of every program, the fastest one is reported (default: 3)")
+    parser.add_argument("--save", metavar="FILE", help="save results as a baseline into the file")
+    parser.add_argument("--baseline", metavar="FILE", help="compare results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default: 0.10)")
+    parser.add_argument("--php", default=shutil.which("php8.1") or shutil.which("php"),
+                        help="PHP executable used to run parse.php on IPPcode22 sources")
+    parser.add_argument("--parse-script", default=os.path.join(REPO_DIR, "parse.php"))
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["programs"]
+
+    results = {}
+    skipped = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for src in find_sources(args.dirs):
+            xml = to_xml(src, args.php, args.parse_script)
+            if xml is None:
+                skipped += 1
+                continue
+            name = os.path.relpath(src, REPO_DIR)
+            result = results[name] = bench_program(args.interpreter, src, xml, tmp_dir, args.repeat)
+            ips = "{0:,.0f} instructions/s".format(result["ips"]) if result["ips"] else "-"
+            change = ""
+            if name in baseline:
+                change = " ({0:+.1%})".format(result["time"] / baseline[name]["time"] - 1)
+            print("{0}: {1:.3f} s{2}, {3}, peak memory {4:.1f} MB{5}".format(
+                name, result["time"], change, ips, result["max_rss"], "" if result["ok"] else ", WRONG RESULT"))
+    if skipped:
+        print("skipped {0} sources which could not be translated to XML".format(skipped), file=sys.stderr)
+
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"interpreter": args.interpreter, "programs": results}, f, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, base_time, new_time in regressions:
+        print("REGRESSION {0}: {1:.3f} s -> {2:.3f} s".format(name, base_time, new_time))
+    wrong = [name for name, result in results.items() if not result["ok"]]
+    if regressions or wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Program loading benchmark for       #
+# interpret.py                        #
+#######################################
+
+"""
+Compares loaders of interpret.py (--loader=iterparse and --loader=expat) - for every program size
+a program is generated (a mix of arithmetic, string, stack and jump instructions with all kinds of operands)
+and loaded by both loaders in the same process. The fastest load time of --repeat loads and the peak memory
+allocated while loading (measured by tracemalloc in a separate load) are reported.
+
+The generated program ends right away (EXIT), so it is also run by the interpreter in a separate process
+with each loader and the CPU time of the whole process is reported - for small programs it is decided
+by the start of the interpreter (e.g. the import of ElementTree, which --loader=expat does not need).
+
+    python3 benchmarks/load_bench.py --size=10 --size=100000
+"""
+
+import argparse
+import gc
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dispatch_bench import load_interpreter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# value of --loader and the function of the interpreter which implements it
+LOADERS = (("iterparse", "load_program"), ("expat", "load_program_expat"))
+
+# instructions repeated in the generated program, {0} is a unique number
+BLOCK = """  <instruction order="{o0}" opcode="LABEL"><arg1 type="label">l{0}</arg1></instruction>
+  <instruction order="{o1}" opcode="ADD">
+    <arg1 type="var">GF@a</arg1><arg2 type="var">GF@a</arg2><arg3 type="int">{0}</arg3>
+  </instruction>
+  <instruction order="{o2}" opcode="CONCAT">
+    <arg1 type="var">GF@s</arg1><arg2 type="string">x\\032y&lt;{0}</arg2><arg3 type="var">GF@s</arg3>
+  </instruction>
+  <instruction order="{o3}" opcode="PUSHS"><arg1 type="bool">true</arg1></instruction>
+  <instruction order="{o4}" opcode="POPS"><arg1 type="var">GF@b</arg1></instruction>
+  <instruction order="{o5}" opcode="JUMPIFEQ">
+    <arg1 type="label">l{0}</arg1><arg2 type="var">GF@b</arg2><arg3 type="nil">nil</arg3>
+  </instruction>
+"""
+BLOCK_SIZE = 6
+
+
+def generate_program(size):
+    """
+    :return: XML source (bytes) of a program with about size instructions
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<program language="IPPcode22">\n',
+             '  <instruction order="1" opcode="EXIT"><arg1 type="int">0</arg1></instruction>\n']
+    order = 2
+    for var in ("a", "s", "b"):
+        parts.append('  <instruction order="{0}" opcode="DEFVAR"><arg1 type="var">GF@{1}</arg1></instruction>\n'
+                     .format(order, var))
+        order += 1
+    parts.append('  <instruction order="{0}" opcode="MOVE">'
+                 '<arg1 type="var">GF@a</arg1><arg2 type="int">0</arg2></instruction>\n'.format(order))
+    parts.append('  <instruction order="{0}" opcode="MOVE">'
+                 '<arg1 type="var">GF@s</arg1><arg2 type="string"></arg2></instruction>\n'.format(order + 1))
+    order += 2
+    for i in range(max(size // BLOCK_SIZE, 1)):
+        orders = {"o{0}".format(k): order + k for k in range(BLOCK_SIZE)}
+        parts.append(BLOCK.format(i, **orders))
+        order += BLOCK_SIZE
+    parts.append("</program>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def measure(interp, loader, xml, repeat):
+    """
+    :return: (fastest load time in seconds, peak memory allocated while loading in MB, number of instructions)
+    """
+    load = getattr(interp, loader)
+    best = None
+    count = 0
+    for _ in range(repeat):
+        interp.reset_state()
+        gc.collect()
+        start = time.perf_counter()
+        count = len(load(io.BytesIO(xml)))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    interp.reset_state()
+    gc.collect()
+    tracemalloc.start()
+    load(io.BytesIO(xml))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2 ** 20, count
+
+
+def measure_process(interpreter, loader, xml_path, repeat):
+    """
+    runs the interpreter on a program in a separate process
+
+    :return: lowest CPU time (user and system) of the process in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        process = subprocess.Popen([sys.executable, interpreter, "--source=" + xml_path, "--input=" + os.devnull,
+                                    "--loader=" + loader], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, _, usage = os.wait4(process.pid, 0)
+        cpu_time = usage.ru_utime + usage.ru_stime
+        best = cpu_time if best is None else min(best, cpu_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load time and memory of interpret.py loaders")
+    parser.add_argument("--interpreter", default=os.path.join(REPO_DIR, "interpret.py"),
+                        help="interpreter to measure (default: interpret.py)")
+    parser.add_argument("--size", action="append", type=int,
+                        help="number of instructions of the program, can be repeated (default: 10, 1000, 100000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of loads of every program, the fastest one is reported (default: 5)")
+    args = parser.parse_args()
+
+    interp = load_interpreter(args.interpreter, 0)
+    loaders = [(name, function) for name, function in LOADERS if hasattr(interp, function)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.size or [10, 1000, 100000]:
+            xml = generate_program(size)
+            xml_path = os.path.join(tmp_dir, "program.xml")
+            with open(xml_path, "wb") as f:
+                f.write(xml)
+            for name, function in loaders:
+                elapsed, peak, count = measure(interp, function, xml, args.repeat)
+                process_time = measure_process(args.interpreter, name, xml_path, args.repeat)
+                print("{0}: {1} instructions ({2} kB), load {3:.3f} ms ({4:.2f} us per instruction), "
+                      "peak memory {5:.2f} MB, whole process {6:.1f} ms CPU".format(
+                          name, count, len(xml) // 1024, elapsed * 1e3, elapsed / count * 1e6, peak,
+                          process_time * 1e3))
+
+
+if __name__ == "__main__":
+    main()
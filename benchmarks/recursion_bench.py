@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Recursion benchmark for             #
+# interpret.py                        #
+#######################################
+
+"""
+Measures the cost of IPPcode22 function calls in deep recursion. For every depth a program is generated,
+which calls a recursive function (CREATEFRAME, DEFVAR, PUSHFRAME, CALL, POPFRAME, RETURN) until the given
+depth is reached and then returns from all the calls. The program is run by the interpreter in a separate
+process, the time per call and the peak memory (maximum resident set size) of the process are reported.
+Time per call should not grow with the depth.
+
+With --locals=N the program also contains another function (called once before the recursion), which defines
+N local variables - frames of the recursive function should not grow with local variables of other functions.
+
+    python3 benchmarks/recursion_bench.py --depth=100000 --depth=1000000 --locals=0 --locals=300
+
+Several interpreters can be compared by repeating --interpreter (see dispatch_bench.py).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# instructions of the program, {depth} is the recursion depth
+INSTRUCTIONS = [
+    '<instruction order="{order}" opcode="CREATEFRAME"/>',
+    '<instruction order="{order}" opcode="DEFVAR"><arg1 type="var">TF@n</arg1></instruction>',
+    '<instruction order="{order}" opcode="MOVE"><arg1 type="var">TF@n</arg1><arg2 type="int">{depth}</arg2>'
+    '</instruction>',
+    '<instruction order="{order}" opcode="PUSHFRAME"/>',
+    '<instruction order="{order}" opcode="CALL"><arg1 type="label">rec</arg1></instruction>',
+    '<instruction order="{order}" opcode="POPFRAME"/>',
+    '<instruction order="{order}" opcode="WRITE"><arg1 type="var">TF@n</arg1></instruction>',
+    '<instruction order="{order}" opcode="JUMP"><arg1 type="label">end</arg1></instruction>',
+    '<instruction order="{order}" opcode="LABEL"><arg1 type="label">rec</arg1></instruction>',
+    '<instruction order="{order}" opcode="JUMPIFEQ">'
+    '<arg1 type="label">ret</arg1><arg2 type="var">LF@n</arg2><arg3 type="int">0</arg3></instruction>',
+    '<instruction order="{order}" opcode="CREATEFRAME"/>',
+    '<instruction order="{order}" opcode="DEFVAR"><arg1 type="var">TF@n</arg1></instruction>',
+    '<instruction order="{order}" opcode="SUB">'
+    '<arg1 type="var">TF@n</arg1><arg2 type="var">LF@n</arg2><arg3 type="int">1</arg3></instruction>',
+    '<instruction order="{order}" opcode="PUSHFRAME"/>',
+    '<instruction order="{order}" opcode="CALL"><arg1 type="label">rec</arg1></instruction>',
+    '<instruction order="{order}" opcode="POPFRAME"/>',
+    '<instruction order="{order}" opcode="LABEL"><arg1 type="label">ret</arg1></instruction>',
+    '<instruction order="{order}" opcode="RETURN"/>',
+    '<instruction order="{order}" opcode="LABEL"><arg1 type="label">end</arg1></instruction>',
+]
+# call of the other function (--locals), at the start of the program
+CALL_MANY_LOCALS = [
+    '<instruction order="{order}" opcode="CREATEFRAME"/>',
+    '<instruction order="{order}" opcode="PUSHFRAME"/>',
+    '<instruction order="{order}" opcode="CALL"><arg1 type="label">many_locals</arg1></instruction>',
+    '<instruction order="{order}" opcode="POPFRAME"/>',
+]
+
+
+def generate_program(depth, local_count):
+    """
+    :param depth: recursion depth
+    :param local_count: number of local variables of the other function (none if 0)
+    :return: XML source of the program
+    """
+    instructions = list(INSTRUCTIONS)
+    if local_count:
+        instructions = CALL_MANY_LOCALS + instructions + [
+            '<instruction order="{order}" opcode="EXIT"><arg1 type="int">0</arg1></instruction>',
+            '<instruction order="{order}" opcode="LABEL"><arg1 type="label">many_locals</arg1></instruction>']
+        instructions += ['<instruction order="{{order}}" opcode="DEFVAR"><arg1 type="var">LF@local{0}</arg1>'
+                         '</instruction>'.format(i) for i in range(local_count)]
+        instructions.append('<instruction order="{order}" opcode="RETURN"/>')
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<program language="IPPcode22">']
+    lines += ["  " + instr.format(order=order, depth=depth) for order, instr in enumerate(instructions, 1)]
+    lines.append("</program>")
+    return "\n".join(lines) + "\n"
+
+
+def run_interpreter(path, src):
+    """
+    runs the interpreter on a program in a separate process
+
+    :return: (return code, wall time in seconds, maximum resident set size in MB)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, path, "--source=" + src, "--input=" + os.devnull],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    return os.waitstatus_to_exitcode(status), elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cost of function calls in deep recursion in interpret.py")
+    parser.add_argument("--interpreter", action="append",
+                        help="interpreter to measure, can be repeated (default: interpret.py)")
+    parser.add_argument("--depth", action="append", type=int,
+                        help="recursion depth, can be repeated (default: 10000, 100000, 1000000)")
+    parser.add_argument("--locals", action="append", type=int,
+                        help="number of local variables of another function of the program, can be repeated "
+                             "(default: 0, 300)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of every program, the fastest one is reported (default: 3)")
+    args = parser.parse_args()
+
+    interpreters = args.interpreter or [os.path.join(REPO_DIR, "interpret.py")]
+    depths = args.depth or [10 ** 4, 10 ** 5, 10 ** 6]
+    local_counts = args.locals or [0, 300]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in interpreters:
+            for depth in depths:
+                for local_count in local_counts:
+                    src = os.path.join(tmp_dir, "recursion_{0}_{1}.xml".format(depth, local_count))
+                    with open(src, "w", encoding="utf-8") as f:
+                        f.write(generate_program(depth, local_count))
+                    runs = [run_interpreter(path, src) for _ in range(args.repeat)]
+                    failed = [rc for rc, _, _ in runs if rc != 0]
+                    if failed:
+                        print("{0}: depth {1}, {2} other locals failed with return code {3}".format(
+                            path, depth, local_count, failed[0]))
+                        continue
+                    elapsed = min(t for _, t, _ in runs)
+                    max_rss = max(rss for _, _, rss in runs)
+                    print("{0}: depth {1}, {2} other locals, {3:.3f} s, {4:.2f} us per call, peak memory {5:.1f} MB"
+                          .format(path, depth, local_count, elapsed, elapsed / depth * 1e6, max_rss))
+
+if __name__ == "__main__":
+    main()
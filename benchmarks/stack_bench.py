@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Stack instructions benchmark for    #
+# interpret.py                        #
+#######################################
+
+"""
+Compares the same programs written with three-address instructions on variables (ADD, LT, JUMPIFEQ, ...)
+and with instructions of the STACK extension on the data stack (ADDS, LTS, JUMPIFEQS, ...). Both forms
+of a program compute the same result, which is checked. Programs are loaded beforehand and only
+the evaluation is timed - runs of both forms alternate, so that a slower period of the machine affects both
+of them, and the fastest of --repeat runs of each form is reported. The number of executed instructions
+is reported too, because the stack form needs more of them (PUSHS and POPS of operands).
+
+    python3 benchmarks/stack_bench.py --iterations=100000
+"""
+
+import argparse
+import os
+import time
+from xml.sax.saxutils import escape
+
+from dispatch_bench import load_interpreter, load_program, program_tables, run_program
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VAR_FRAMES = ("GF@", "LF@", "TF@")
+CONST_TYPES = ("int@", "bool@", "string@", "nil@")
+
+
+def arith(n):
+    """
+    sum of (i * 3 + 7) - i // 2 for i in 0..n-1
+    """
+    head = [("DEFVAR", "GF@i"), ("DEFVAR", "GF@sum"), ("MOVE", "GF@i", "int@0"), ("MOVE", "GF@sum", "int@0")]
+    tail = [("WRITE", "GF@sum")]
+    variables = head + [("DEFVAR", "GF@t"), ("DEFVAR", "GF@u"), ("LABEL", "loop"),
+                        ("MUL", "GF@t", "GF@i", "int@3"), ("ADD", "GF@t", "GF@t", "int@7"),
+                        ("IDIV", "GF@u", "GF@i", "int@2"), ("SUB", "GF@t", "GF@t", "GF@u"),
+                        ("ADD", "GF@sum", "GF@sum", "GF@t"), ("ADD", "GF@i", "GF@i", "int@1"),
+                        ("JUMPIFNEQ", "loop", "GF@i", "int@{0}".format(n))] + tail
+    stack = head + [("LABEL", "loop"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@3"), ("MULS",), ("PUSHS", "int@7"), ("ADDS",),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@2"), ("IDIVS",), ("SUBS",),
+                    ("PUSHS", "GF@sum"), ("ADDS",), ("POPS", "GF@sum"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@1"), ("ADDS",), ("POPS", "GF@i"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@{0}".format(n)), ("JUMPIFNEQS", "loop")] + tail
+    return variables, stack
+
+
+def logic(n):
+    """
+    number of i in 0..n-1 for which i < n / 2 and not i % 3 == 0
+    """
+    head = [("DEFVAR", "GF@i"), ("DEFVAR", "GF@count"), ("DEFVAR", "GF@m"),
+            ("MOVE", "GF@i", "int@0"), ("MOVE", "GF@count", "int@0")]
+    tail = [("WRITE", "GF@count")]
+    variables = head + [("DEFVAR", "GF@b"), ("DEFVAR", "GF@c"), ("LABEL", "loop"),
+                        ("IDIV", "GF@m", "GF@i", "int@3"), ("MUL", "GF@m", "GF@m", "int@3"),
+                        ("SUB", "GF@m", "GF@i", "GF@m"),
+                        ("LT", "GF@b", "GF@i", "int@{0}".format(n // 2)), ("EQ", "GF@c", "GF@m", "int@0"),
+                        ("NOT", "GF@c", "GF@c"), ("AND", "GF@b", "GF@b", "GF@c"),
+                        ("JUMPIFNEQ", "skip", "GF@b", "bool@true"), ("ADD", "GF@count", "GF@count", "int@1"),
+                        ("LABEL", "skip"), ("ADD", "GF@i", "GF@i", "int@1"),
+                        ("JUMPIFNEQ", "loop", "GF@i", "int@{0}".format(n))] + tail
+    stack = head + [("LABEL", "loop"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "GF@i"), ("PUSHS", "int@3"), ("IDIVS",), ("PUSHS", "int@3"),
+                    ("MULS",), ("SUBS",), ("POPS", "GF@m"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@{0}".format(n // 2)), ("LTS",),
+                    ("PUSHS", "GF@m"), ("PUSHS", "int@0"), ("EQS",), ("NOTS",), ("ANDS",),
+                    ("PUSHS", "bool@true"), ("JUMPIFNEQS", "skip"),
+                    ("PUSHS", "GF@count"), ("PUSHS", "int@1"), ("ADDS",), ("POPS", "GF@count"),
+                    ("LABEL", "skip"), ("PUSHS", "GF@i"), ("PUSHS", "int@1"), ("ADDS",), ("POPS", "GF@i"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@{0}".format(n)), ("JUMPIFNEQS", "loop")] + tail
+    return variables, stack
+
+
+def chars(n):
+    """
+    sum of codes of characters made by INT2CHAR from 97 + i % 26 and read back by STRI2INT
+    """
+    head = [("DEFVAR", "GF@i"), ("DEFVAR", "GF@sum"), ("DEFVAR", "GF@c"),
+            ("MOVE", "GF@i", "int@0"), ("MOVE", "GF@sum", "int@0")]
+    tail = [("WRITE", "GF@sum")]
+    variables = head + [("LABEL", "loop"),
+                        ("IDIV", "GF@c", "GF@i", "int@26"), ("MUL", "GF@c", "GF@c", "int@26"),
+                        ("SUB", "GF@c", "GF@i", "GF@c"), ("ADD", "GF@c", "GF@c", "int@97"),
+                        ("INT2CHAR", "GF@c", "GF@c"), ("STRI2INT", "GF@c", "GF@c", "int@0"),
+                        ("ADD", "GF@sum", "GF@sum", "GF@c"), ("ADD", "GF@i", "GF@i", "int@1"),
+                        ("JUMPIFNEQ", "loop", "GF@i", "int@{0}".format(n))] + tail
+    stack = head + [("LABEL", "loop"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "GF@i"), ("PUSHS", "int@26"), ("IDIVS",), ("PUSHS", "int@26"),
+                    ("MULS",), ("SUBS",), ("PUSHS", "int@97"), ("ADDS",), ("INT2CHARS",),
+                    ("PUSHS", "int@0"), ("STRI2INTS",), ("PUSHS", "GF@sum"), ("ADDS",), ("POPS", "GF@sum"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@1"), ("ADDS",), ("POPS", "GF@i"),
+                    ("PUSHS", "GF@i"), ("PUSHS", "int@{0}".format(n)), ("JUMPIFNEQS", "loop")] + tail
+    return variables, stack
+
+
+PROGRAMS = (("arith", arith), ("logic", logic), ("chars", chars))
+
+
+def to_xml(instructions):
+    """
+    :param instructions: list of instructions as tuples (opcode, operands in IPPcode22 syntax)
+    :return: XML representation of the program as bytes
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<program language="IPPcode22">\n']
+    for order, (opcode, *operands) in enumerate(instructions, 1):
+        parts.append('  <instruction order="{0}" opcode="{1}">'.format(order, opcode))
+        for index, operand in enumerate(operands, 1):
+            if operand.startswith(VAR_FRAMES):
+                arg_type, text = "var", operand
+            elif operand.startswith(CONST_TYPES):
+                arg_type, text = operand.split("@", 1)
+            else:
+                arg_type, text = "label", operand
+            parts.append('<arg{0} type="{1}">{2}</arg{0}>'.format(index, arg_type, escape(text)))
+        parts.append("</instruction>\n")
+    parts.append("</program>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def measure(interp, xmls, repeat):
+    """
+    :param xmls: XML sources of the forms of a program
+    :return: list with (fastest evaluation time in seconds, number of executed instructions, output of the program)
+     of every form
+    """
+    loaded = []
+    for xml in xmls:
+        program = load_program(interp, xml)
+        loaded.append((program, program_tables(interp)))
+    results = [[None, 0, ""] for _ in xmls]
+    for _ in range(repeat):
+        for (program, tables), result in zip(loaded, results):
+            start = time.perf_counter()
+            result[1] = run_program(interp, program, "", tables=tables)
+            elapsed = time.perf_counter() - start
+            result[0] = elapsed if result[0] is None else min(result[0], elapsed)
+            # the output is short, it stays in the buffer of the writer (run_program does not flush it)
+            result[2] = "".join(interp.OUT.parts)
+    return [tuple(result) for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stack and variable forms of programs in interpret.py")
+    parser.add_argument("--interpreter", default=os.path.join(REPO_DIR, "interpret.py"),
+                        help="interpreter to measure (default: interpret.py)")
+    parser.add_argument("--iterations", type=int, default=20000,
+                        help="number of iterations of the loop of every program (default: 20000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs of every program, the fastest one is reported (default: 5)")
+    args = parser.parse_args()
+
+    interp = load_interpreter(args.interpreter, 0)
+    for name, generate in PROGRAMS:
+        results = measure(interp, [to_xml(instructions) for instructions in generate(args.iterations)], args.repeat)
+        (var_time, var_count, var_output), (stack_time, stack_count, stack_output) = results
+        print("{0}: variables {1:.3f} s ({2} instructions), stack {3:.3f} s ({4} instructions), "
+              "stack/variables {5:.2f}x{6}".format(name, var_time, var_count, stack_time, stack_count,
+                                                   stack_time / var_time,
+                                                   "" if var_output == stack_output else ", DIFFERENT RESULTS"))
+
+
+if __name__ == "__main__":
+    main()
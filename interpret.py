@@ -9,8 +9,18 @@
 #######################################
 
 import sys
+import os
+import stat
 import re
-import xml.etree.ElementTree as Xml
+import io
+import codecs
+import json
+import time
+import marshal
+import operator
+import contextlib
+from collections import OrderedDict
+import xml.parsers.expat as expat
 
 
 class ParamsError(Exception):
@@ -21,6 +31,10 @@ class FileOpenError(Exception):
     """couldn't open input files (e.g. file doesn't exist, you don't have required permissions etc.)"""
 
 
+class FileWriteError(Exception):
+    """couldn't open output files (e.g. you don't have required permissions)"""
+
+
 class XMLFormatError(Exception):
     """wrong XML format within input file (file isn't well-formed)"""
 
@@ -57,6 +71,14 @@ class StringError(Exception):
     """runtime error - string manipulation error"""
 
 
+class LimitError(Exception):
+    """runtime error - limit of executed instructions or time of the interpretation exceeded"""
+
+
+class ProgramExit(Exception):
+    """instruction EXIT - the interpretation ends with the return code given as the first argument"""
+
+
 class InternalError(Exception):
     """internal script error"""
 
@@ -71,13 +93,715 @@ CS = []
 DS = []
 # Label dictionary - stores labels
 LD = {}
+# Variable slots - positions of global and local (temporary) variables in their frames
+GVS = {}
+LVS = {}
+# number of instructions executed as parts of fused instructions (see optimize_program),
+# the evaluator loop counts every fused instruction only once
+FUSED_STEPS = 0
+# profiler of the interpretation (None if the program is not profiled)
+PROF = None
+# statistics of the interpretation (None if no statistics are collected)
+STATS = None
+# watchdog of the interpretation limits (None if there are no limits)
+WATCH = None
+# if True, the program is evaluated by compiled basic blocks (see eval_blocks)
+COMPILE = False
+# reader of the program input (instruction READ)
+IN = None
+# writer of the program output (instruction WRITE)
+OUT = None
 
-zero_arg_instr_list = ["CREATEFRAME", "PUSHFRAME", "POPFRAME", "RETURN", "BREAK"]
-one_arg_instr_list = ["DEFVAR", "POPS", "LABEL", "CALL", "JUMP", "PUSHS", "WRITE", "EXIT", "DPRINT"]
-two_arg_instr_list = ["MOVE", "INT2CHAR", "STRLEN", "TYPE", "NOT", "READ"]
-three_arg_instr_list = ["ADD", "SUB", "MUL", "IDIV", "LT", "GT", "EQ", "AND", "OR", "CONCAT",
-                        "GETCHAR", "SETCHAR", "STRI2INT", "JUMPIFEQ", "JUMPIFNEQ"]
 var_types = ["int", "string", "bool", "nil"]
+eq_instr_list = ["EQ", "JUMPIFEQ", "JUMPIFNEQ", "EQS", "JUMPIFEQS", "JUMPIFNEQS"]
+jump_instr_list = ["CALL", "JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS"]
+# instructions which end a basic block of eval_blocks (they change the control flow or print the number
+# of executed instructions)
+block_end_instrs = frozenset(jump_instr_list + ["RETURN", "BREAK"])
+arithmetic_operators = {"ADD": operator.add, "SUB": operator.sub, "MUL": operator.mul}
+esc_seq_regex = re.compile(r"\\([0-9]{3})")
+input_int_regex = re.compile(r"[+-]?[0-9]+")
+
+
+frame_kinds = ["GF", "LF", "TF"]
+
+# Signatures of instructions - kinds of their operands in order, the number of operands is the arity;
+# XML types allowed for a kind are in operand_types, operands of other kinds ("type" of READ, operand
+# of PUSHS) are not checked by the semantic check
+instr_signatures = {
+    "CREATEFRAME": (),
+    "PUSHFRAME": (),
+    "POPFRAME": (),
+    "RETURN": (),
+    "BREAK": (),
+    "DEFVAR": ("var",),
+    "POPS": ("var",),
+    "LABEL": ("label",),
+    "CALL": ("label",),
+    "JUMP": ("label",),
+    "PUSHS": (None,),
+    "WRITE": ("symb",),
+    "EXIT": ("symb",),
+    "DPRINT": ("symb",),
+    "MOVE": ("var", "symb"),
+    "INT2CHAR": ("var", "symb"),
+    "STRLEN": ("var", "symb"),
+    "TYPE": ("var", "symb"),
+    "NOT": ("var", "symb"),
+    "READ": ("var", "type"),
+    "ADD": ("var", "symb", "symb"),
+    "SUB": ("var", "symb", "symb"),
+    "MUL": ("var", "symb", "symb"),
+    "IDIV": ("var", "symb", "symb"),
+    "LT": ("var", "symb", "symb"),
+    "GT": ("var", "symb", "symb"),
+    "EQ": ("var", "symb", "symb"),
+    "AND": ("var", "symb", "symb"),
+    "OR": ("var", "symb", "symb"),
+    "CONCAT": ("var", "symb", "symb"),
+    "GETCHAR": ("var", "symb", "symb"),
+    "SETCHAR": ("var", "symb", "symb"),
+    "STRI2INT": ("var", "symb", "symb"),
+    "JUMPIFEQ": ("label", "symb", "symb"),
+    "JUMPIFNEQ": ("label", "symb", "symb"),
+    # extension STACK - operands are taken from the data stack
+    "CLEARS": (),
+    "ADDS": (),
+    "SUBS": (),
+    "MULS": (),
+    "IDIVS": (),
+    "LTS": (),
+    "GTS": (),
+    "EQS": (),
+    "ANDS": (),
+    "ORS": (),
+    "NOTS": (),
+    "INT2CHARS": (),
+    "STRI2INTS": (),
+    "JUMPIFEQS": ("label",),
+    "JUMPIFNEQS": ("label",),
+}
+# instruction with an unknown opcode is checked as if its second operand was a symb, its arity is not checked
+# (the instruction fails when it is executed)
+unknown_instr_signature = (None, "symb")
+operand_types = {
+    "var": frozenset(["var"]),
+    "label": frozenset(["label"]),
+    "symb": frozenset(var_types + ["var"]),
+}
+arg_tags = ("arg1", "arg2", "arg3")
+
+# format of programs in the cache directory (see pack_program), changed when the format changes
+program_cache_format = 1
+
+# Values are immutable (type, value) tuples - the type is one of var_types and the value is
+# a native Python int, bool, str or None (nil); a defined variable without a value holds None
+NIL = ("nil", None)
+TRUE = ("bool", True)
+FALSE = ("bool", False)
+
+# Frames are indexed by variable slots (see assign_var_slots) - the global frame is a list, local and temporary
+# frames are dictionaries of defined variables only (see LocalFrame); a variable which has not been defined
+# in the frame (DEFVAR) reads as UNDEF
+UNDEF = object()
+
+# shorter strings built by CONCAT or changed by SETCHAR stay native Python strings (see StrBuf)
+str_buf_min_len = 256
+
+
+class StrBuf:
+    """
+    value of a long string built by CONCAT or changed by SETCHAR - a list of characters shared by all versions
+    of the string: the newest version owns the list and changes it in place, an older version only remembers
+    how it differs from the next one (it is shorter, or has another character on one position) and gets its
+    own list when it is used again; so appending and SETCHAR do not copy the whole string, len() is O(1)
+    and indexing of the newest version is O(1)
+
+    it can be used in place of a Python string (len(), indexing, str(), comparisons), the flat string
+    is made only when a whole string is needed (WRITE, comparison) and it is kept
+    """
+    __slots__ = ("chars", "length", "next", "diff", "flat")
+
+    def __init__(self, chars):
+        """
+        :param chars: list of characters, the new string owns it
+        """
+        self.chars = chars
+        self.length = len(chars)
+        self.next = None  # newer version of the string (if this one is not the newest)
+        self.diff = None  # (position, character) which SETCHAR changed in the next version, None if it appended
+        self.flat = None
+
+    def own_chars(self):
+        """
+        :return: list of characters of this version (an older version gets its own list first)
+        """
+        if self.chars is None:
+            if self.flat is not None:
+                chars = list(self.flat)
+            else:
+                older = []
+                version = self
+                while version.chars is None:
+                    older.append(version)
+                    version = version.next
+                chars = version.chars[:]
+                for version in reversed(older):
+                    if version.diff is None:
+                        del chars[version.length:]
+                    else:
+                        chars[version.diff[0]] = version.diff[1]
+            self.chars = chars
+            self.next = None
+            self.diff = None
+        return self.chars
+
+    def advance(self, chars, diff):
+        """
+        gives the (changed) list of characters to a new version of the string
+
+        :return: the new version
+        """
+        newer = StrBuf(chars)
+        self.chars = None
+        self.next = newer
+        self.diff = diff
+        return newer
+
+    def append(self, string):
+        """
+        :return: new version of the string with given string appended
+        """
+        chars = self.own_chars()
+        chars.extend(string)
+        return self.advance(chars, None)
+
+    def set_char(self, pos, char):
+        """
+        :return: new version of the string with a character on given position replaced
+        """
+        chars = self.own_chars()
+        diff = (pos, chars[pos])
+        chars[pos] = char
+        return self.advance(chars, diff)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.own_chars()[index]
+
+    def __str__(self):
+        if self.flat is None:
+            self.flat = "".join(self.own_chars())
+        return self.flat
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return str(self) != str(other)
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __gt__(self, other):
+        return str(self) > str(other)
+
+
+class Arg:
+    """
+    decoded instruction argument - its type and text are read from XML only once, when the program is loaded;
+    arguments of type "var" also carry the frame kind, the (interned) name of the referenced variable
+    and its slot in the frame, constants carry their value (see NIL)
+    """
+    __slots__ = ("type", "text", "frame", "name", "slot", "value")
+
+    def __init__(self, arg_type, text):
+        self.type = arg_type
+        self.text = text
+        self.frame = None
+        self.name = None
+        self.slot = None
+        self.value = None
+        if arg_type == "var":
+            parts = text.split("@") if text is not None else []
+            if len(parts) < 2 or parts[0] not in frame_kinds:
+                raise_err(UnexpectedXMLStructure)
+            self.frame = sys.intern(parts[0])
+            self.name = sys.intern(parts[1])
+        elif arg_type == "string":
+            self.text = process_esc_seq_in_str(text)
+            self.value = ("string", self.text)
+        elif arg_type == "int":
+            try:
+                self.value = ("int", int(text))
+            except (TypeError, ValueError):
+                raise_err(UnexpectedXMLStructure)
+        elif arg_type == "bool":
+            self.value = TRUE if text == "true" else FALSE
+        elif arg_type == "nil":
+            self.value = NIL
+
+
+class Instruction:
+    """
+    decoded instruction - upper-cased opcode, a tuple of decoded arguments, its order
+    and the handler that evaluates the instruction (looked up only once);
+    jump instructions also carry the position of their target label and
+    instructions fused with the following instruction carry what the fused handler needs
+    """
+    __slots__ = ("opcode", "args", "order", "handler", "target", "fused")
+
+    def __init__(self, opcode, args, order=None):
+        self.opcode = opcode
+        self.args = args
+        self.order = order
+        self.handler = instr_handlers.get(opcode, instr_unknown)
+        self.target = None
+        self.fused = None
+
+
+class Params:
+    """
+    interpreter parameters given on the command line
+    """
+
+    def __init__(self):
+        self.src = None
+        self.inp = None
+        self.output_buffer = 65536
+        self.binary_output = False
+        self.optimize = False
+        self.compile = False
+        self.profile = None
+        self.profile_top = 10
+        self.stats = None
+        self.stats_list = []
+        self.max_steps = None
+        self.timeout = None
+        self.dump_on_limit = False
+        self.daemon = None
+        self.cache_dir = None
+        self.cache_size = None
+        self.loader = "iterparse"
+
+
+class InputReader:
+    """
+    reader of the program input - the input is read in large chunks which are split into lines,
+    instruction READ then takes the lines one by one; a piped standard input is read by chunks
+    of whatever is already available (so that a program driven line by line does not wait
+    for a full chunk) and an interactive standard input (terminal) is read line by line
+    """
+    __slots__ = ("stream", "chunk_size", "strip", "is_stdin", "buffer", "decoder", "lines", "pos", "rest", "eof")
+
+    def __init__(self, stream, chunk_size=1 << 20, strip=True, is_stdin=False):
+        """
+        :param stream: input stream opened in text mode
+        :param chunk_size: number of characters read at once (at most, for standard input)
+        :param strip: if True, whitespace around every line is removed (input file),
+                      otherwise only the line ending is removed (standard input)
+        :param is_stdin: if True, the output is flushed before the reader waits for more input
+        """
+        self.stream = stream
+        self.chunk_size = 1 if is_stdin and stream.isatty() else chunk_size
+        self.strip = strip
+        self.is_stdin = is_stdin
+        # binary buffer of a piped standard input and decoder of its encoding (line endings are kept as they are,
+        # same as sys.stdin does)
+        self.buffer = None
+        self.decoder = None
+        if is_stdin and self.chunk_size != 1 and hasattr(stream, "buffer"):
+            self.buffer = stream.buffer
+            self.decoder = codecs.getincrementaldecoder(stream.encoding)(stream.errors)
+        self.lines = []
+        self.pos = 0
+        self.rest = ""
+        self.eof = False
+
+    def read_chunk(self):
+        """
+        :return: next chunk of the input, empty string at the end of the input
+        """
+        if self.chunk_size == 1:
+            return self.stream.readline()
+        if self.buffer is None:
+            return self.stream.read(self.chunk_size)
+        # read1() returns as soon as some data is available, it waits only when the pipe is empty
+        data = self.buffer.read1(self.chunk_size)
+        chunk = self.decoder.decode(data, not data)
+        while data and not chunk:
+            # only a part of a multi-byte character has arrived
+            data = self.buffer.read1(self.chunk_size)
+            chunk = self.decoder.decode(data, not data)
+        return chunk
+
+    def fill(self):
+        """
+        reads next chunk of the input and splits it into complete lines
+        """
+        if self.is_stdin:
+            OUT.flush()  # prompt written by the program has to be visible before reading
+        chunk = self.read_chunk()
+        if not chunk:
+            self.eof = True
+            self.lines = [self.rest] if self.rest else []
+            self.rest = ""
+        else:
+            self.lines = (self.rest + chunk).split("\n")
+            self.rest = self.lines.pop()
+        self.pos = 0
+
+    def readline(self):
+        """
+        :return: next line of the input (without the line ending) or None at the end of the input
+        """
+        while self.pos >= len(self.lines):
+            if self.eof:
+                return None
+            self.fill()
+        line = self.lines[self.pos]
+        self.pos += 1
+        return line.strip() if self.strip else line
+
+
+class OutputWriter:
+    """
+    buffered writer of the program output - strings written by instruction WRITE are collected
+    and written into the stream at once, when the buffer is full or when the writer is flushed
+    (on EXIT, on error and when the program ends)
+    """
+    __slots__ = ("stream", "limit", "binary", "parts", "size")
+
+    def __init__(self, stream, limit=65536, binary=False):
+        """
+        :param stream: output stream (sys.stdout, or sys.stdout.buffer if binary is True)
+        :param limit: size of the buffer in characters (0 means no buffering)
+        :param binary: if True, output is encoded into UTF-8 and written as bytes
+        """
+        self.stream = stream
+        self.limit = limit
+        self.binary = binary
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            data = "".join(self.parts)
+            self.parts = []
+            self.size = 0
+            self.stream.write(data.encode("utf-8") if self.binary else data)
+        self.stream.flush()
+
+
+class Watchdog:
+    """
+    limits of the interpretation (--max-steps, --timeout) - they are not checked after every instruction,
+    the evaluator loop asks the watchdog only when the number of executed instructions reaches the value
+    returned by its last check (at least every check_interval instructions)
+    """
+    __slots__ = ("max_steps", "timeout", "dump", "check_interval", "deadline")
+
+    def __init__(self, max_steps=None, timeout=None, dump=False, check_interval=4096):
+        """
+        :param max_steps: maximal number of executed instructions (None means no limit)
+        :param timeout: maximal time of the interpretation in seconds (None means no limit)
+        :param dump: if True, status of the interpreter (see BREAK) is printed when a limit is exceeded
+        :param check_interval: maximal number of instructions executed between two checks
+        """
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.dump = dump
+        self.check_interval = check_interval
+        self.deadline = None
+
+    def check(self, executed_i, iip, instr):
+        """
+        checks the limits before the next instruction is executed
+
+        :param executed_i: number of executed instructions - 1 (same as in the evaluator loop)
+        :param iip: internal instruction pointer of the next instruction
+        :param instr: the next instruction
+        :return: (value of executed_i when the limits have to be checked again,
+         handler which evaluates the next instruction)
+        """
+        clock = time.perf_counter()
+        if self.deadline is None and self.timeout is not None:
+            self.deadline = clock + self.timeout
+        steps = executed_i + 1 + FUSED_STEPS
+        if self.max_steps is not None and steps >= self.max_steps \
+                or self.deadline is not None and clock >= self.deadline:
+            if self.dump:
+                print_interpreter_status(iip, steps)
+            raise_err(LimitError)
+        next_check = executed_i + self.check_interval
+        handler = instr.handler
+        if self.max_steps is not None:
+            # a fused instruction (see optimize_program) executes two instructions at once,
+            # so the rest of the limit is halved to check it in time
+            next_check = min(next_check, executed_i + max((self.max_steps - steps) // 2, 1))
+            if steps + 2 > self.max_steps and handler in fused_handlers:
+                # only the first instruction of the pair fits into the limit, it is evaluated on its own
+                # and the limit is exceeded before the second one, same as without --optimize
+                handler = instr_handlers[instr.opcode]
+        return next_check, handler
+
+    def eval(self, program):
+        """
+        evaluates the program the same way as eval_instructions() does, with the limits checked
+
+        :param program: list of decoded instructions
+        :return: number of executed instructions
+        """
+        executed_i = -1
+        iip = 0
+        count = len(program)
+        next_check = -1
+        while iip < count:
+            instr = program[iip]
+            handler = instr.handler
+            if executed_i >= next_check:
+                next_check, handler = self.check(executed_i, iip, instr)
+            executed_i += 1
+            iip = handler(instr, iip, executed_i) + 1
+        return executed_i + 1 + FUSED_STEPS
+
+
+class Profiler:
+    """
+    profiler of the interpretation (--profile=file) - the program is evaluated by an instrumented loop,
+    which counts hits and measures time of every instruction; the report is written as JSON
+    when the interpretation ends (also on EXIT and on error)
+    """
+    __slots__ = ("stream", "top", "program", "hits", "times", "start")
+
+    def __init__(self, stream, top=10):
+        """
+        :param stream: output stream of the report
+        :param top: number of the hottest instructions in the report
+        """
+        self.stream = stream
+        self.top = top
+        self.program = []
+        self.hits = []
+        self.times = []
+        self.start = None
+
+    def eval(self, program):
+        """
+        evaluates the program the same way as eval_instructions() does
+
+        :param program: list of decoded instructions
+        :return: number of executed instructions
+        """
+        self.program = program
+        hits = self.hits = [0] * len(program)
+        times = self.times = [0.0] * len(program)
+        clock = time.perf_counter
+        self.start = clock()
+        executed_i = -1
+        iip = 0
+        count = len(program)
+        next_check = -1 if WATCH is not None else float("inf")
+        while iip < count:
+            instr = program[iip]
+            handler = instr.handler
+            if executed_i >= next_check:
+                next_check, handler = WATCH.check(executed_i, iip, instr)
+            executed_i += 1
+            hits[iip] += 1
+            start = clock()
+            try:
+                next_iip = handler(instr, iip, executed_i) + 1
+            finally:
+                # the instruction which ends the program (EXIT, error) is timed too
+                times[iip] += clock() - start
+            iip = next_iip
+        return executed_i + 1 + FUSED_STEPS
+
+    def instr_name(self, position):
+        """
+        :return: opcode of the instruction on given position, fused instructions
+         are named by both opcodes (e.g. "EQ+JUMPIFEQ")
+        """
+        instr = self.program[position]
+        if instr.handler in fused_handlers:
+            return instr.opcode + "+" + self.program[position + 1].opcode
+        return instr.opcode
+
+    def report(self):
+        """
+        :return: dictionary with the profile - numbers of executions and cumulative time (in seconds)
+         of opcodes, hits of every instruction (by its position in the program) and the hottest instructions
+        """
+        opcodes = {}
+        for position, hits in enumerate(self.hits):
+            if hits:
+                stats = opcodes.setdefault(self.instr_name(position), {"count": 0, "time": 0.0})
+                stats["count"] += hits
+                stats["time"] += self.times[position]
+        hottest = sorted((position for position, hits in enumerate(self.hits) if hits),
+                         key=lambda position: self.hits[position], reverse=True)[:self.top]
+        return {
+            "executed_instructions": sum(self.hits) + FUSED_STEPS,
+            "time": time.perf_counter() - self.start if self.start is not None else 0.0,
+            "opcodes": dict(sorted(opcodes.items(), key=lambda item: item[1]["time"], reverse=True)),
+            "hits": self.hits,
+            "hottest": [{
+                "position": position,
+                "order": self.program[position].order,
+                "opcode": self.instr_name(position),
+                "args": [arg.text for arg in self.program[position].args],
+                "hits": self.hits[position],
+                "time": self.times[position],
+            } for position in hottest],
+        }
+
+    def write(self):
+        """
+        writes the report into the output stream and closes it
+        """
+        json.dump(self.report(), self.stream, indent=2)
+        self.stream.write("\n")
+        self.stream.close()
+
+
+class Stats:
+    """
+    statistics of the interpretation (extension STATI, --stats=file) - the program is evaluated
+    by a loop which counts executions of every instruction and, if --vars is requested, initialized
+    variables; the statistics are written after the interpretation ends successfully (also on EXIT)
+    """
+    __slots__ = ("stream", "stats", "program", "hits", "vars", "max_vars")
+
+    # instructions which are not counted by --insts and --hot
+    not_counted = ("LABEL", "DPRINT", "BREAK")
+
+    def __init__(self, stream, stats):
+        """
+        :param stream: output stream of the statistics
+        :param stats: requested statistics in the order of output ("insts", "hot", "vars", "frequent")
+        """
+        self.stream = stream
+        self.stats = stats
+        self.program = []
+        self.hits = []
+        self.vars = 0
+        self.max_vars = 0
+
+    def eval(self, program):
+        """
+        evaluates the program the same way as eval_instructions() does
+
+        :param program: list of decoded instructions
+        :return: number of executed instructions
+        """
+        self.program = program
+        hits = self.hits = [0] * len(program)
+        executed_i = -1
+        iip = 0
+        count = len(program)
+        next_check = -1 if WATCH is not None else float("inf")
+        if "vars" not in self.stats:
+            while iip < count:
+                instr = program[iip]
+                handler = instr.handler
+                if executed_i >= next_check:
+                    next_check, handler = WATCH.check(executed_i, iip, instr)
+                executed_i += 1
+                hits[iip] += 1
+                iip = handler(instr, iip, executed_i) + 1
+            return executed_i + 1 + FUSED_STEPS
+
+        # variable which can be initialized by the instruction on given position,
+        # instructions CREATEFRAME and POPFRAME throw the temporary frame away
+        assigned = [None] * len(program)
+        drops_frame = [False] * len(program)
+        for position, instr in enumerate(program):
+            if instr.handler is instr_fused_pushs_pops:
+                assigned[position] = instr.fused
+            elif instr_signatures.get(instr.opcode, ())[:1] == ("var",) and instr.opcode != "DEFVAR":
+                assigned[position] = instr.args[0]
+            drops_frame[position] = instr.opcode in ("CREATEFRAME", "POPFRAME")
+        while iip < count:
+            instr = program[iip]
+            handler = instr.handler
+            if executed_i >= next_check:
+                next_check, handler = WATCH.check(executed_i, iip, instr)
+            executed_i += 1
+            hits[iip] += 1
+            var = assigned[iip]
+            if var is not None:
+                frame = get_frame(var.frame)
+                uninitialized = frame is not None and frame[var.slot] is None
+                iip = handler(instr, iip, executed_i) + 1
+                if uninitialized and frame[var.slot] is not None:
+                    self.vars += 1
+                    if self.vars > self.max_vars:
+                        self.max_vars = self.vars
+            elif drops_frame[iip]:
+                dropped = TF
+                iip = handler(instr, iip, executed_i) + 1
+                if dropped is not None:
+                    self.vars -= sum(1 for val in dropped.values() if val is not None)
+            else:
+                iip = handler(instr, iip, executed_i) + 1
+        return executed_i + 1 + FUSED_STEPS
+
+    def executions(self):
+        """
+        :return: number of executions of every instruction by its position,
+         the second instruction of a fused pair is executed as many times as the first one
+        """
+        executions = list(self.hits)
+        for position, hits in enumerate(self.hits):
+            if hits and self.program[position].handler in fused_handlers:
+                executions[position + 1] += hits
+        return executions
+
+    def stat(self, name, executions):
+        """
+        :param name: name of the statistic
+        :param executions: numbers of executions of instructions (see executions())
+        :return: value of the statistic as a string
+        """
+        counted = [(hits, instr) for hits, instr in zip(executions, self.program)
+                   if instr.opcode not in self.not_counted]
+        if name == "insts":
+            return str(sum(hits for hits, _ in counted))
+        elif name == "hot":
+            hot = [(-hits, instr.order) for hits, instr in counted if hits]
+            return str(min(hot)[1]) if hot else ""
+        elif name == "vars":
+            return str(self.max_vars)
+        # frequent - the most frequent opcodes in the source code
+        frequency = {}
+        for instr in sorted(self.program, key=lambda x: x.order):
+            frequency[instr.opcode] = frequency.get(instr.opcode, 0) + 1
+        top = max(frequency.values(), default=0)
+        return ",".join(opcode for opcode, n in frequency.items() if n == top)
+
+    def write(self):
+        """
+        writes requested statistics (one per line) into the output stream and closes it
+        """
+        executions = self.executions()
+        for name in self.stats:
+            self.stream.write(self.stat(name, executions) + "\n")
+        self.stream.close()
 
 
 def raise_err(err):
@@ -89,6 +813,8 @@ def raise_err(err):
     msg = ""
     if err == ParamsError:
         msg = "missing script parameter (if necessary) or use of forbidden combination of parameters"
+    elif err == FileWriteError:
+        msg = "couldn't open output files"
     elif err == XMLFormatError:
         msg = "wrong XML format within input file (file isn't well-formed)"
     elif err == UnexpectedXMLStructure:
@@ -107,24 +833,25 @@ def raise_err(err):
         msg = "runtime error - wrong operand value (e.g. division by zero, wrong return value of instruction EXIT etc.)"
     elif err == StringError:
         msg = "runtime error - string manipulation error"
+    elif err == LimitError:
+        msg = "runtime error - limit of executed instructions or time of the interpretation exceeded"
     elif err == InternalError:
         msg = "internal program error"
     raise err(msg)
 
 
-def exit_err(err_type, msg):
+def error_code(err_type):
     """
-    exits the program with the correct return value and a fitting error message
-
     :param err_type: type of error
-    :param msg: error message
+    :return: return value of the interpreter for given type of error
     """
     err_num = 0
     if err_type == ParamsError:
         err_num = 10
-    elif err_type == FileOpenError:
-        msg = "couldn't open input files (file probably doesn't exist or you don't have required permissions)"
+    elif err_type in (FileOpenError, FileNotFoundError):
         err_num = 11
+    elif err_type == FileWriteError:
+        err_num = 12
     elif err_type == XMLFormatError:
         err_num = 31
     elif err_type == UnexpectedXMLStructure:
@@ -143,10 +870,24 @@ def exit_err(err_type, msg):
         err_num = 57
     elif err_type == StringError:
         err_num = 58
+    elif err_type == LimitError:
+        err_num = 59
     elif err_type == InternalError:
         err_num = 99
+    return err_num
+
+
+def exit_err(err_type, msg):
+    """
+    exits the program with the correct return value and a fitting error message
+
+    :param err_type: type of error
+    :param msg: error message
+    """
+    if err_type in (FileOpenError, FileNotFoundError):
+        msg = "couldn't open input files (file probably doesn't exist or you don't have required permissions)"
     print("Error: {0}".format(msg), file=sys.stderr)
-    sys.exit(err_num)
+    sys.exit(error_code(err_type))
 
 
 def print_help():
@@ -171,6 +912,70 @@ input file with an XML representation of a source code
 
 --input=file
 file with inputs used for interpretation of a specified source code
+
+--output-buffer=size
+size of the output buffer in characters (default 65536, 0 turns buffering off)
+
+--binary-output
+write output as UTF-8 bytes directly into the standard output buffer
+
+--optimize
+fuse common pairs of instructions into single instructions before the interpretation,
+number of applied fusions is written on standard error output
+
+--compile
+evaluate the program by basic blocks compiled into Python closures with their operands already bound
+(faster for loops), the program behaves the same way; --profile, --stats, --max-steps and --timeout
+evaluate the program by their own loop
+
+--profile=file
+write execution profile of the program (numbers of executions and time of opcodes and instructions)
+as JSON into the file when the interpretation ends
+
+--profile-top=N
+number of the hottest instructions in the profile (default 10)
+
+--stats=file [--insts] [--hot] [--vars] [--frequent]
+write statistics of the interpretation into the file (one per line, in the order of parameters),
+when the interpretation ends successfully:
+  --insts     number of executed instructions (without LABEL, DPRINT and BREAK)
+  --hot       order of the most executed instruction (the smallest order if there are more of them)
+  --vars      maximal number of initialized variables in all frames at once
+  --frequent  the most frequent opcodes in the source code (separated by commas)
+--stats can not be combined with --profile
+
+--max-steps=N
+end the interpretation with error 59 when it should execute more than N instructions
+
+--timeout=seconds
+end the interpretation with error 59 when it runs for more than given number of seconds
+(checked every few thousands of instructions)
+
+--dump-on-limit
+print status of the interpreter (as instruction BREAK does) on standard error output
+when a limit is exceeded
+
+--daemon
+--daemon=socket
+run as a daemon which interprets many programs without starting the interpreter again - jobs are read
+from standard input (or from connections to the Unix socket) as JSON objects, one per line:
+  {"id": ..., "source": "<xml>" or "source_file": "file", "input": "text" or "input_file": "file"}
+and for every job a JSON object {"id": ..., "stdout": ..., "stderr": ..., "rc": ...} is written back;
+options --output-buffer, --optimize, --compile, --max-steps, --timeout, --dump-on-limit, --loader
+and --cache-dir apply to every job; an existing socket file is replaced, if the path exists and is not
+a socket or the socket can not be created, the daemon does not start (return code 12)
+
+--loader=iterparse
+--loader=expat
+how the XML source is read - iterparse (default) reads it by ElementTree, expat assembles instructions directly
+by callbacks of the expat parser without building ElementTree elements (faster for short-running programs)
+
+--cache-dir=directory
+checked and decoded programs are stored in the directory (keyed by a hash of the source and of the interpreter),
+later runs of the same program load them from there instead of reading and checking the XML source
+
+--cache-size=N
+maximal number of programs in the cache directory, the least recently used ones are removed (default 256)
 """)
 
 
@@ -179,23 +984,20 @@ def composed_of_whitespace(x):
     checks and returns if input string is composed of
     whitespace characters only
     """
-    if x is not None:
-        if re.search("\S+", x):
-            return False
-    return True
+    return not x or x.isspace()
 
 
 def process_esc_seq_in_str(string):
     """
-    replaces escape sequences with actual characters in given string
+    replaces escape sequences with actual characters in given string (in a single pass);
+    string literals are processed only once, when the program is loaded, so every string
+    value stored in frames or on the data stack is already decoded
 
     :return: string with escape sequences replaced
     """
     if not string:
         return ""
-    for i in range(0, 999):
-        string = string.replace("\\{:03}".format(i), chr(i))
-    return string
+    return esc_seq_regex.sub(lambda m: chr(int(m.group(1))), string)
 
 
 def check_root_attrib(root):
@@ -217,139 +1019,258 @@ def check_root_attrib(root):
         raise_err(UnexpectedXMLStructure)
 
 
-def check_arg_xml(argc, instr):
-    """
-    checks XML format of instruction arguments
-
-    :param argc: number of arguments
-    :param instr: instruction to check
-    """
-    arg_list = ["arg1", "arg2", "arg3"]
-    for i in range(argc):
-        curr_arg = instr[i]
-        if curr_arg.tag != arg_list[i]:
-            raise_err(UnexpectedXMLStructure)
-        if not composed_of_whitespace(curr_arg.tail):
-            raise_err(UnexpectedXMLStructure)
-        if "type" not in curr_arg.attrib or len(curr_arg.attrib) != 1 or len(curr_arg) != 0:
-            raise_err(UnexpectedXMLStructure)
-
-
-def check_instr_xml(root):
+def check_instr_xml(instr, arity):
     """
-    checks XML format of root instructions and their arguments
+    checks XML format of an instruction and its arguments
 
-    :param root: main program composed of instructions
+    :param instr: instruction to check (with sorted arguments)
+    :param arity: number of arguments of the instruction (None if it is not known)
     """
-    for instr in root:
-        i_opcode = instr.attrib.get("opcode").upper()
-        argc = len(list(instr))
-
-        if not composed_of_whitespace(instr.text) or not composed_of_whitespace(instr.tail):
-            raise_err(UnexpectedXMLStructure)
-        if instr.tag != "instruction":
+    if not composed_of_whitespace(instr.text) or not composed_of_whitespace(instr.tail):
+        raise_err(UnexpectedXMLStructure)
+    if instr.tag != "instruction":
+        raise_err(UnexpectedXMLStructure)
+    if arity is not None and len(instr) != arity:
+        raise_err(UnexpectedXMLStructure)
+    for i, arg in enumerate(instr):
+        if i >= len(arg_tags) or arg.tag != arg_tags[i] or not composed_of_whitespace(arg.tail):
             raise_err(UnexpectedXMLStructure)
-
-        # check correct argument count depending on instruction opcode
-        if i_opcode in zero_arg_instr_list and argc != 0 or \
-                i_opcode in one_arg_instr_list and argc != 1 or \
-                i_opcode in two_arg_instr_list and argc != 2 or \
-                i_opcode in three_arg_instr_list and argc != 3:
+        if "type" not in arg.attrib or len(arg.attrib) != 1 or len(arg) != 0:
             raise_err(UnexpectedXMLStructure)
-        check_arg_xml(argc, instr)
 
 
 def check_symb_sem(arg, arg_type, type_to_check):
     """
     if given argument type is semantically correct <symb> type, function
-    returns the value of that argument depending on its specific
+    returns the (native) value of that argument depending on its specific
     type defined by the user (e.g. "int","string",..)
 
     :param arg: instruction argument
     :param arg_type: program-given argument type
     :param type_to_check: user-given argument type
     """
-    if (arg_type != type_to_check) and (arg_type != "var"):
-        raise_err(OperandsError)
     if arg_type == "var":
-        var = get_or_update_var(arg, None, False)
-        if var[0] not in var_types:
+        var = get_var(arg)
+        if var is None:
             raise_err(MissingValError)
         if var[0] != type_to_check:
             raise_err(OperandsError)
-        elif var[0] == "int":
-            return int(var[1])
-        elif var[0] == "string":
-            return process_esc_seq_in_str(var[1])
-        elif var[0] == "bool":
-            return var[1]
-    elif arg_type == "int":
-        return int(arg.text)
-    elif arg_type == "string":
-        return process_esc_seq_in_str(arg.text)
-    elif arg_type == "bool":
-        return arg.text
-
-
-def handle_args():
-    """
-    handles program arguments - checks for interpreter input/source or potentially both of them
-    or prints help
-
-    :return: (src, inp): tuple of source file and input file
-    """
-    if len(sys.argv) == 2:
-        # looking for either help, source or input in a program argument
-        arg = sys.argv[1]
-        help_found = re.search("^(--h|--help)$", arg)
-        source_found = re.search("^--source=.*$", arg)
-        input_found = re.search("^--input=.*$", arg)
-        if help_found:
+        return var[1]
+    if arg_type != type_to_check:
+        raise_err(OperandsError)
+    return arg.value[1]
+
+
+def handle_args(argv):
+    """
+    handles program arguments - checks for interpreter input/source or potentially both of them,
+    output options or prints help
+
+    :param argv: program arguments (without the name of the script)
+    :return: interpreter parameters
+    """
+    params = Params()
+    for arg in argv:
+        if re.search("^(--h|--help)$", arg):
+            if len(argv) != 1:
+                raise_err(ParamsError)
             print_help()
             sys.exit(0)
-        elif source_found:
-            src = re.split("--source=", arg)[1]
-            return src, None
-        elif input_found:
-            inp = re.split("--input=", arg)[1]
-            return None, inp
-
-    elif len(sys.argv) == 3:
-        src = None
-        inp = None
-        # looking for both source and input in program arguments
-        for arg in sys.argv:
-            src_search = re.search("^--source=.*$", arg)
-            inp_search = re.search("^--input=.*$", arg)
-            if src_search is not None:
-                src = re.split("--source=", src_search.group())[1]
-            if inp_search is not None:
-                inp = re.split("--input=", inp_search.group())[1]
-        if src and inp:
-            return src, inp
+        elif re.search("^--source=.*$", arg):
+            params.src = re.split("--source=", arg, maxsplit=1)[1]
+        elif re.search("^--input=.*$", arg):
+            params.inp = re.split("--input=", arg, maxsplit=1)[1]
+        elif re.search("^--output-buffer=[0-9]+$", arg):
+            params.output_buffer = int(re.split("--output-buffer=", arg, maxsplit=1)[1])
+        elif arg == "--binary-output":
+            params.binary_output = True
+        elif arg == "--optimize":
+            params.optimize = True
+        elif arg == "--compile":
+            params.compile = True
+        elif re.search("^--profile=.+$", arg):
+            params.profile = re.split("--profile=", arg, maxsplit=1)[1]
+        elif re.search("^--profile-top=[0-9]+$", arg):
+            params.profile_top = int(re.split("--profile-top=", arg, maxsplit=1)[1])
+        elif re.search("^--stats=.+$", arg):
+            params.stats = re.split("--stats=", arg, maxsplit=1)[1]
+        elif arg in ("--insts", "--hot", "--vars", "--frequent"):
+            params.stats_list.append(arg[2:])
+        elif re.search("^--max-steps=[0-9]+$", arg):
+            params.max_steps = int(re.split("--max-steps=", arg, maxsplit=1)[1])
+        elif re.search("^--timeout=[0-9]+(\\.[0-9]+)?$", arg):
+            params.timeout = float(re.split("--timeout=", arg, maxsplit=1)[1])
+        elif arg == "--dump-on-limit":
+            params.dump_on_limit = True
+        elif arg == "--daemon":
+            params.daemon = ""
+        elif re.search("^--daemon=.+$", arg):
+            params.daemon = re.split("--daemon=", arg, maxsplit=1)[1]
+        elif re.search("^--cache-dir=.+$", arg):
+            params.cache_dir = re.split("--cache-dir=", arg, maxsplit=1)[1]
+        elif re.search("^--loader=(iterparse|expat)$", arg):
+            params.loader = re.split("--loader=", arg, maxsplit=1)[1]
+        elif re.search("^--cache-size=[0-9]+$", arg):
+            params.cache_size = int(re.split("--cache-size=", arg, maxsplit=1)[1])
         else:
             raise_err(ParamsError)
-    else:
+    # size of the cache of programs needs the cache directory
+    if params.cache_size is not None and (params.cache_dir is None or params.cache_size == 0):
         raise_err(ParamsError)
+    if params.daemon is not None:
+        # jobs of the daemon carry their own source and input, profile and statistics belong to one program
+        if params.src is not None or params.inp is not None or params.profile is not None \
+                or params.stats is not None:
+            raise_err(ParamsError)
+        return params
+    # at least one of the source and input files has to be given, the other one is read from standard input
+    if params.src is None and params.inp is None:
+        raise_err(ParamsError)
+    # statistics have to be written into a file, they are collected by their own evaluator loop
+    if params.stats_list and params.stats is None or params.stats is not None and params.profile is not None:
+        raise_err(ParamsError)
+    return params
 
 
-def fill_label_dict_with_labels(root):
+def fill_label_dict_with_labels(program):
     """
     attaches program labels with their correct positions and stores
      them in the label dictionary
+
+    :param program: list of decoded instructions
     """
     global LD
     count = 0
-    for instr in root:
-        opcode = instr.get("opcode").upper()
-        if opcode == "LABEL":
-            arg = instr[0]
-            if arg.text in LD:  # label is already defined
+    for instr in program:
+        if instr.opcode == "LABEL":
+            label = instr.args[0].text
+            if label in LD:  # label is already defined
                 raise_err(SemanticsError)
-            LD[arg.text] = count  # adds {"label": order} into label dict
+            LD[label] = count  # adds {"label": order} into label dict
         count += 1
 
 
+def resolve_jump_targets(program):
+    """
+    replaces labels of jump instructions with positions of these labels in the program,
+    jump to an undefined label is a semantic error
+
+    :param program: list of decoded instructions
+    """
+    for instr in program:
+        if instr.opcode in jump_instr_list:
+            label = instr.args[0].text
+            if label not in LD:
+                raise_err(SemanticsError)
+            instr.target = LD[label]
+
+
+def assign_var_slots(program):
+    """
+    gives every variable of the program a slot (index) in its frame - global variables are numbered
+    in GVS, local and temporary variables share LVS, because a temporary frame becomes a local one
+    after PUSHFRAME
+
+    :param program: list of decoded instructions
+    """
+    for instr in program:
+        for arg in instr.args:
+            if arg.type == "var":
+                slots = GVS if arg.frame == "GF" else LVS
+                arg.slot = slots.setdefault(arg.name, len(slots))
+
+
+def is_same_var(arg, var):
+    """
+    :return: True if the argument references the same variable as the argument var
+    """
+    return arg.type == "var" and arg.frame == var.frame and arg.name == var.name
+
+
+def fuse_instructions(instr, following):
+    """
+    fuses an instruction with the following one if they form one of known patterns:
+    LT/GT/EQ var + JUMPIFEQ/JUMPIFNEQ label var bool, PUSHS + POPS and MOVE var + WRITE var
+
+    :param instr: instruction
+    :param following: instruction following the instruction in the program
+    :return: True if the instructions were fused
+    """
+    if instr.handler is instr_relational and following.opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+        var = instr.args[0]
+        _, symb1, symb2 = following.args
+        if is_same_var(symb1, var) and symb2.type == "bool":
+            const = symb2.value[1]
+        elif is_same_var(symb2, var) and symb1.type == "bool":
+            const = symb1.value[1]
+        else:
+            return False
+        jump_if = const if following.opcode == "JUMPIFEQ" else not const
+        instr.fused = (following.target, jump_if)
+        instr.handler = instr_fused_relational_jump
+    elif instr.handler is instr_pushs and following.opcode == "POPS":
+        instr.fused = following.args[0]
+        instr.handler = instr_fused_pushs_pops
+    elif instr.handler is instr_move and following.opcode == "WRITE" \
+            and is_same_var(following.args[0], instr.args[0]):
+        instr.handler = instr_fused_move_write
+    else:
+        return False
+    return True
+
+
+def optimize_program(program):
+    """
+    replaces pairs of instructions by fused instructions (see fuse_instructions) - a fused instruction
+    evaluates both instructions at once and skips the second one, which stays in the program;
+    the second instruction is never a label or an instruction following CALL, so it can not be reached
+    by a jump or by RETURN on its own
+
+    :param program: list of decoded instructions with resolved jump targets
+    :return: number of applied fusions
+    """
+    fusions = 0
+    i = 0
+    while i < len(program) - 1:
+        if fuse_instructions(program[i], program[i + 1]):
+            fusions += 1
+            i += 2
+        else:
+            i += 1
+    return fusions
+
+
+class LocalFrame(dict):
+    """
+    local or temporary frame - values of defined variables by their slot in LVS; LVS numbers local variables
+    of the whole program, so only defined variables are stored and a frame does not grow with local variables
+    of other functions (a slot of an undefined variable reads as UNDEF, same as in the global frame)
+    """
+    __slots__ = ()
+
+    def __missing__(self, slot):
+        return UNDEF
+
+
+def new_frame(slots):
+    """
+    :param slots: variable slots of the global frame (GVS)
+    :return: new global frame without any defined variable
+    """
+    return [UNDEF] * len(slots)
+
+
+def frame_to_dict(frame, slots):
+    """
+    :param frame: frame (list or LocalFrame of variable values) or None
+    :param slots: variable slots of the frame (GVS or LVS)
+    :return: defined variables of the frame as a dictionary {name: value} (None if the frame does not exist)
+    """
+    if frame is None:
+        return None
+    return {name: frame[slot] for name, slot in slots.items() if frame[slot] is not UNDEF}
+
+
 def print_interpreter_status(iip, executed_i):
     """
     prints statuses of main elements of the program on standard error output
@@ -383,42 +1304,69 @@ Call Stack
 Data Stack
 {7}
 ----------------------------------------
-""".format(iip, executed_i, GF, LF, TF, FS, CS, DS, file=sys.stderr)
+""".format(iip, executed_i, frame_to_dict(GF, GVS), frame_to_dict(LF, LVS), frame_to_dict(TF, LVS),
+           [frame_to_dict(frame, LVS) for frame in FS], CS, DS), file=sys.stderr
     )
 
 
-def check_in_frame(frame, var):
-    if frame is None and frame != GF:
+def reset_state():
+    """
+    resets frames, stacks and the label dictionary to their initial (empty) state,
+    so that another program can be interpreted within the same process
+    """
+    global GF, LF, TF, FS, CS, DS, LD, GVS, LVS, FUSED_STEPS, PROF, STATS, WATCH, COMPILE, OUT
+    GF = []
+    LF = None
+    TF = None
+    FS = []
+    CS = []
+    DS = []
+    LD = {}
+    GVS = {}
+    LVS = {}
+    FUSED_STEPS = 0
+    PROF = None
+    STATS = None
+    WATCH = None
+    COMPILE = False
+    OUT = OutputWriter(sys.stdout)
+
+
+def check_in_frame(frame, slot):
+    if frame is None:
         raise_err(NonexistentFrameError)
-    if var not in frame:
+    if frame[slot] is UNDEF:
         raise_err(NonexistentVarError)
 
 
-def check_not_in_frame(frame, var):
-    if frame is None and frame != GF:
+def check_not_in_frame(frame, slot):
+    if frame is None:
         raise_err(NonexistentFrameError)
-    if var in frame:
+    if frame[slot] is not UNDEF:
         raise_err(SemanticsError)
 
 
+def get_frame(frame_kind):
+    """
+    :param frame_kind: one of "GF", "LF", "TF"
+    :return: frame of given kind (None if the frame does not exist)
+    """
+    if frame_kind == "GF":
+        return GF
+    elif frame_kind == "LF":
+        return LF
+    return TF
+
+
 def define_var(arg):
     """
     defines variable in frame determined by the argument
 
     :param arg: instruction argument
     """
-    global LF, TF, GF
-    frame = arg.text.split("@")[0]
-    var = arg.text.split("@")[1]
-    if frame == "LF":
-        check_not_in_frame(LF, var)
-        LF[var] = ["", ""]
-    elif frame == "TF":
-        check_not_in_frame(TF, var)
-        TF[var] = ["", ""]
-    elif frame == "GF":
-        check_not_in_frame(GF, var)
-        GF[var] = ["", ""]
+    frame = get_frame(arg.frame)
+    check_not_in_frame(frame, arg.slot)
+    frame[arg.slot] = None
 
 
 def check_is_var_defined(arg):
@@ -427,50 +1375,59 @@ def check_is_var_defined(arg):
 
     :param arg: instruction argument
     """
-    global LF, TF, GF
-    frame = arg.text.split("@")[0]
-    var = arg.text.split("@")[1]
-    if frame == "LF":
-        check_in_frame(LF, var)
-    elif frame == "TF":
-        check_in_frame(TF, var)
-    elif frame == "GF":
-        check_in_frame(GF, var)
+    check_in_frame(get_frame(arg.frame), arg.slot)
 
 
-def get_or_update_var(arg, val, to_update):
+def get_var(arg):
     """
-    if to_update is True: updates a variable in frame with a user-given value
-    if to_update is False: returns a variable from frame
+    returns the value of a variable referenced by the argument (None if the variable has no value yet)
 
-    :param arg: instruction argument
+    :param arg: instruction argument of type "var"
+    """
+    frame = get_frame(arg.frame)
+    if frame is None:
+        raise_err(NonexistentFrameError)
+    val = frame[arg.slot]
+    if val is UNDEF:
+        raise_err(NonexistentVarError)
+    return val
+
+
+def set_var(arg, val):
+    """
+    updates a variable referenced by the argument with a user-given value
+
+    :param arg: instruction argument of type "var"
     :param val: value to update the frame with
-    :param to_update: decides if function should update or get value
     """
-    global DS, GF, LF, TF
-    frame = arg.text.split("@")[0]
-    var = arg.text.split("@")[1]
+    frame = get_frame(arg.frame)
+    if frame is None:
+        raise_err(NonexistentFrameError)
+    if frame[arg.slot] is UNDEF:
+        raise_err(NonexistentVarError)
+    frame[arg.slot] = val
 
-    if frame == "LF":
-        check_in_frame(LF, var)
-        if to_update:
-            LF[var] = [val[0], val[1]]
-        else:
-            val = LF.get(var)
-    elif frame == "TF":
-        check_in_frame(TF, var)
-        if to_update:
-            TF[var] = [val[0], val[1]]
-        else:
-            val = TF.get(var)
-    elif frame == "GF":
-        check_in_frame(GF, var)
-        if to_update:
-            GF[var] = [val[0], val[1]]
-        else:
-            val = GF.get(var)
-    if not to_update:
+
+def get_symb(arg):
+    """
+    :return: value of a <symb> argument - of the referenced variable or of the constant
+    """
+    if arg.type == "var":
+        val = get_var(arg)
+        is_nonempty(val)
         return val
+    return arg.value
+
+
+def value_to_str(val):
+    """
+    :return: text representation of a value used by WRITE and DPRINT
+    """
+    if val[0] == "bool":
+        return "true" if val[1] else "false"
+    elif val[0] == "nil":
+        return ""
+    return str(val[1])
 
 
 def write_var(arg, arg_type, write_on_err):
@@ -481,158 +1438,143 @@ def write_var(arg, arg_type, write_on_err):
     :param arg_type: type of argument
     :param write_on_err: if True, function writes on standard error output, otherwise on standard output
     """
-    if arg_type == "nil":
-        var_value = ""
-    elif arg_type == "var":
-        val = get_or_update_var(arg, None, False)
-        is_nonempty(val)
-        if val[0] == "nil":
-            var_value = ""
-        else:
-            var_value = val[1]
-    elif arg_type == "string":
-        var_value = process_esc_seq_in_str(arg.text)
+    var_value = value_to_str(get_symb(arg))
+    if write_on_err:
+        sys.stderr.write(var_value)
+        sys.stderr.flush()
     else:
-        var_value = arg.text
-    print(var_value, file=sys.stderr, end='') if write_on_err else print(var_value, end='')
+        OUT.write(var_value)
 
 
-def zero_arg_instructions_eval(i_opcode, iip, executed_i):
-    """
-    processes instructions that have zero arguments
-
-    :param i_opcode: instruction opcode
-    :param iip: internal instruction pointer
-    :param executed_i: number of executed instructions
-    :return: None on failure
-    """
-    global TF, FS, CS, LF
-    if i_opcode == "CREATEFRAME":
-        TF = {}
-    elif i_opcode == "PUSHFRAME":
-        if TF is None:
-            raise_err(NonexistentFrameError)
-        if TF is not None:
-            LF = dict(TF)
-        FS.append(LF)
-        TF = None
-    elif i_opcode == "POPFRAME":
-        if LF is None or not FS:
-            raise_err(NonexistentFrameError)
-        TF = FS.pop()
-        if FS:
-            LF = FS[-1]
-        else:
-            LF = None
-    elif i_opcode == "RETURN":
-        if not CS:
-            raise_err(MissingValError)
-        iip = int(CS.pop()) - 1
-    elif i_opcode == "BREAK":
-        print_interpreter_status(iip, executed_i)
-    else:
-        return None
+def instr_createframe(instr, iip, executed_i):
+    global TF
+    TF = LocalFrame()
     return iip
 
 
-def exit_instr(arg, arg_type):
-    exit_code = check_symb_sem(arg, arg_type, "int")
-    if 0 <= exit_code <= 49:
-        sys.exit(exit_code)
-    else:
-        raise_err(OperandValError)
+def instr_pushframe(instr, iip, executed_i):
+    global TF, LF
+    if TF is None:
+        raise_err(NonexistentFrameError)
+    LF = TF  # the frame is moved, not copied - TF is emptied below
+    FS.append(LF)
+    TF = None
+    return iip
 
 
-def eval_jump(arg, iip):
-    if arg.text in LD:
-        iip = int(LD.get(arg.text)) - 1
+def instr_popframe(instr, iip, executed_i):
+    global TF, LF
+    if LF is None or not FS:
+        raise_err(NonexistentFrameError)
+    TF = FS.pop()
+    if FS:
+        LF = FS[-1]
     else:
-        raise_err(SemanticsError)
+        LF = None
     return iip
 
 
-def one_arg_instructions_eval(instr, i_opcode, iip):
-    """
-    processes instructions that have one argument
+def instr_return(instr, iip, executed_i):
+    if not CS:
+        raise_err(MissingValError)
+    return CS.pop() - 1
 
-    :param instr: current instruction
-    :param i_opcode: instruction opcode
-    :param iip: internal instruction pointer
-    :return: None on failure
-    """
-    global CS, DS
-    arg = instr[0]
-    arg_type = arg.get("type")
-    if i_opcode == "DEFVAR":
-        define_var(arg)
-    elif i_opcode == "CALL":
-        CS.append(iip + 1)
-        iip = eval_jump(arg, iip)
-    elif i_opcode == "JUMP":
-        iip = eval_jump(arg, iip)
-    elif i_opcode == "PUSHS":
-        if arg_type == "var":
-            val = get_or_update_var(arg, None, False)
-            is_nonempty(val)
-            DS.append(val)
-        else:
-            DS.append([arg_type, arg.text])
-    elif i_opcode == "POPS":
-        if not DS:
-            raise_err(MissingValError)
-        val = DS.pop()
-        get_or_update_var(arg, val, True)
-    elif i_opcode == "WRITE":
-        write_var(arg, arg_type, False)
-    elif i_opcode == "EXIT":
-        exit_instr(arg, arg_type)
-    elif i_opcode == "DPRINT":
-        write_var(arg, arg_type, True)
-    elif i_opcode == "LABEL":
-        pass
+
+def instr_break(instr, iip, executed_i):
+    print_interpreter_status(iip, executed_i + FUSED_STEPS)
+    return iip
+
+
+def exit_instr(arg, arg_type):
+    exit_code = check_symb_sem(arg, arg_type, "int")
+    if 0 <= exit_code <= 49:
+        raise ProgramExit(exit_code)
     else:
-        return None
+        raise_err(OperandValError)
+
+
+def instr_defvar(instr, iip, executed_i):
+    define_var(instr.args[0])
     return iip
 
 
-def read(to_update, var_type, input_file):
+def instr_call(instr, iip, executed_i):
+    CS.append(iip + 1)
+    return instr.target - 1
+
+
+def instr_jump(instr, iip, executed_i):
+    return instr.target - 1
+
+
+def instr_pushs(instr, iip, executed_i):
+    DS.append(get_symb(instr.args[0]))
+    return iip
+
+
+def instr_pops(instr, iip, executed_i):
+    if not DS:
+        raise_err(MissingValError)
+    set_var(instr.args[0], DS.pop())
+    return iip
+
+
+def instr_write(instr, iip, executed_i):
+    arg = instr.args[0]
+    write_var(arg, arg.type, False)
+    return iip
+
+
+def instr_exit(instr, iip, executed_i):
+    arg = instr.args[0]
+    exit_instr(arg, arg.type)
+    return iip
+
+
+def instr_dprint(instr, iip, executed_i):
+    arg = instr.args[0]
+    write_var(arg, arg.type, True)
+    return iip
+
+
+def instr_label(instr, iip, executed_i):
+    return iip
+
+
+def read(to_update, var_type):
     """
-    reads from user-specified input file and saves the read variable
+    reads a line from the program input and saves the read variable
 
     :param to_update: variable to save to
     :param var_type: type of variable to save
-    :param input_file: input file
     """
-    if input_file is None:
-        user_input = input()
-    else:
-        user_input = input_file.readline()
-        user_input = "nil" if user_input == '' else user_input.strip()  # empty file
+    user_input = IN.readline()
+    if user_input is None:  # end of input
+        user_input = "nil"
 
     actual_type = var_type.text
     if user_input == "nil":
-        pass
+        val = NIL
     elif actual_type == "int":
-        user_input = int(user_input) if re.search("^[+-]?[0-9]*$", user_input) else "nil"
+        val = ("int", int(user_input)) if input_int_regex.fullmatch(user_input) else NIL
     elif actual_type == "bool":
-        user_input = "true" if re.search("^true$", user_input, flags=re.I) else "false"
+        val = TRUE if user_input.lower() == "true" else FALSE
     elif actual_type == "string":
-        pass
+        val = ("string", user_input)
     elif actual_type == "nil":
-        user_input = "nil"
+        val = NIL
     else:
         raise_err(SemanticsError)
-    to_make = var_type.text if user_input != "nil" else "nil"
-    get_or_update_var(to_update, [to_make, user_input], True)
+    set_var(to_update, val)
 
 
 def type_eval(arg1, arg2, arg2_type):
     if arg2_type == "var":
-        var_type = get_or_update_var(arg2, None, False)[0]
+        val = get_var(arg2)
+        var_type = val[0] if val is not None else ""
     else:
         var_type = arg2_type
-    var = ["string", var_type]
-    get_or_update_var(arg1, var, True)
+    set_var(arg1, ("string", var_type))
 
 
 def not_eval(var, symb, symb_type):
@@ -643,21 +1585,16 @@ def not_eval(var, symb, symb_type):
     :param symb: symbol to execute the NOT operation on
     :param symb_type: type of the symbol
     """
-    val = []
     if symb_type == "var":
-        val = get_or_update_var(symb, None, False)
+        val = get_var(symb)
         is_nonempty(val)
         if val[0] != "bool":
             raise_err(OperandsError)
     elif symb_type == "bool":
-        val = [symb_type, symb.text]
+        val = symb.value
     else:
         raise_err(OperandsError)
-    if val[1] == "true":
-        val[1] = "false"
-    else:
-        val[1] = "true"
-    get_or_update_var(var, val, True)
+    set_var(var, FALSE if val[1] else TRUE)
 
 
 def int_to_char_eval(var, symb, symb_type):
@@ -672,48 +1609,54 @@ def int_to_char_eval(var, symb, symb_type):
     int_val = check_symb_sem(symb, symb_type, "int")
     if not (0 < int_val < max_ascii_val):
         raise_err(StringError)
-    get_or_update_var(var, ["string", chr(int_val)], True)
+    set_var(var, ("string", chr(int_val)))
 
 
 def is_nonempty(val):
-    if val[0] not in var_types:
+    if val is None:
         raise_err(MissingValError)
 
 
-def two_arg_instructions_eval(instr, i_opcode, iip, input_file):
-    """
-    processes instructions that have two arguments
+def instr_move(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    set_var(arg1, get_symb(arg2))
+    return iip
 
-    :param instr: current instruction
-    :param i_opcode: instruction opcode
-    :param iip: internal instruction pointer
-    :param input_file: input file
-
-    :return: None on failure
-    """
-    global GF, TF, LF, FS, CS, DS, LD
-    arg1 = instr[0]
-    arg2 = instr[1]
-    arg2_type = arg2.get("type")
-    if i_opcode in two_arg_instr_list:
-        check_is_var_defined(arg1)
-    if i_opcode == "MOVE":
-        val = get_or_update_var(arg2, None, False) if arg2_type == "var" else [arg2_type, arg2.text]
-        is_nonempty(val)
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "INT2CHAR":
-        int_to_char_eval(arg1, arg2, arg2_type)
-    elif i_opcode == "READ":
-        read(arg1, arg2, input_file)
-    elif i_opcode == "STRLEN":
-        str_len = len(check_symb_sem(arg2, arg2_type, "string"))
-        get_or_update_var(arg1, ["int", str_len], True)
-    elif i_opcode == "TYPE":
-        type_eval(arg1, arg2, arg2_type)
-    elif i_opcode == "NOT":
-        not_eval(arg1, arg2, arg2_type)
-    else:
-        return None
+
+def instr_int2char(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    int_to_char_eval(arg1, arg2, arg2.type)
+    return iip
+
+
+def instr_read(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    read(arg1, arg2)
+    return iip
+
+
+def instr_strlen(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    str_len = len(check_symb_sem(arg2, arg2.type, "string"))
+    set_var(arg1, ("int", str_len))
+    return iip
+
+
+def instr_type(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    type_eval(arg1, arg2, arg2.type)
+    return iip
+
+
+def instr_not(instr, iip, executed_i):
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    not_eval(arg1, arg2, arg2.type)
     return iip
 
 
@@ -759,9 +1702,9 @@ def bool_operations_eval(i_opcode, symb1, symb1_type, symb2, symb2_type):
     b2 = check_symb_sem(symb2, symb2_type, "bool")
     result = None
     if i_opcode == "AND":
-        result = "true" if b1 == "true" and b2 == "true" else "false"
+        result = b1 and b2
     elif i_opcode == "OR":
-        result = "true" if b1 == "true" or b2 == "true" else "false"
+        result = b1 or b2
     return result
 
 
@@ -787,11 +1730,23 @@ def concat_eval(symb1, symb1_type, symb2, symb2_type):
     :return: concatenated strings
     """
     s1 = check_symb_sem(symb1, symb1_type, "string")
-    s2 = check_symb_sem(symb2, symb2_type, "string")
-    if s1 is None or s2 is None:
-        return ""
-    s = s1 + s2
-    return s
+    s2 = str(check_symb_sem(symb2, symb2_type, "string"))
+    return concat_strings(s1, s2)
+
+
+def concat_strings(s1, s2):
+    """
+    :param s1: string 1 (str or StrBuf)
+    :param s2: string 2 (str)
+    :return: concatenated strings, a long result is a StrBuf
+    """
+    if type(s1) is StrBuf:
+        return s1.append(s2)
+    if len(s1) + len(s2) < str_buf_min_len:
+        return s1 + s2
+    chars = list(s1)
+    chars.extend(s2)
+    return StrBuf(chars)
 
 
 def set_char_eval(var, symb1, symb1_type, symb2, symb2_type):
@@ -805,7 +1760,7 @@ def set_char_eval(var, symb1, symb1_type, symb2, symb2_type):
     :param symb2_type: type of symbol 2
     :return: evaluation result
     """
-    to_replace = get_or_update_var(var, None, False)
+    to_replace = get_var(var)
     is_nonempty(to_replace)
     if to_replace[0] != "string":
         raise_err(OperandsError)
@@ -813,75 +1768,50 @@ def set_char_eval(var, symb1, symb1_type, symb2, symb2_type):
     arg_pos = check_symb_sem(symb1, symb1_type, "int")
     arg_str = check_symb_sem(symb2, symb2_type, "string")
 
-    if 0 > arg_pos or arg_pos >= len(to_replace[1]) or arg_str == "":
+    string = to_replace[1]
+    if 0 > arg_pos or arg_pos >= len(string) or len(arg_str) == 0:
         raise_err(StringError)
 
-    arg_str = list(arg_str)
-
-    to_replace[1] = to_replace[1][:arg_pos] + arg_str[0] + to_replace[1][arg_pos + 1:]
-    return to_replace[1]
-
-
-def get_val(val):
-    """
-    :return: actual processed value of val
-    """
-    text = val[1]
-    arg_type = val[0]
-    if arg_type == "int":
-        return int(text)
-    elif arg_type == "bool":
-        return True if text == "true" else False
-    elif arg_type == "string":
-        return process_esc_seq_in_str(text)
-    elif arg_type == "nil":
-        return text
-    else:
-        raise_err(OperandsError)
+    if type(string) is StrBuf:
+        return string.set_char(arg_pos, arg_str[0])
+    if len(string) < str_buf_min_len:
+        return string[:arg_pos] + arg_str[0] + string[arg_pos + 1:]
+    return StrBuf(list(string)).set_char(arg_pos, arg_str[0])
 
 
 def compare_values(i_opcode, arg2, arg2_type, arg3, arg3_type):
     """
-    prepares two arguments for comparison depending on how
-    they are supposed to be evaluated and compares their values
+    compares values of two arguments depending on the opcode - both values
+    have to be of the same type, only EQ (and conditional jumps) accept nil
 
     :return: comparison of values depending on OPCODE
     """
-    if arg2_type == "var":
-        val1 = get_or_update_var(arg2, None, False)
-    else:
-        val1 = [arg2.get("type"), arg2.text]
-    if arg3_type == "var":
-        val2 = get_or_update_var(arg3, None, False)
-    else:
-        val2 = [arg3.get("type"), arg3.text]
-    if val1[0] not in var_types or val2[0] not in var_types:
+    val1 = get_var(arg2) if arg2_type == "var" else arg2.value
+    val2 = get_var(arg3) if arg3_type == "var" else arg3.value
+    if val1 is None or val2 is None:
         raise_err(MissingValError)
-    if val1[0] != "nil" and val2[0] != "nil" and arg2_type != "nil" and arg3_type != "nil":
-        if arg2_type != arg3_type and val1[0] != val2[0]:
+    if val1[0] == "nil" or val2[0] == "nil":
+        if i_opcode not in eq_instr_list:
             raise_err(OperandsError)
-
-    cmp1 = get_val(val1)
-    cmp2 = get_val(val2)
-
-    if i_opcode in ["EQ", "JUMPIFEQ", "JUMPIFNEQ"]:
-        if cmp1 is not None and cmp2 is not None:
-            return cmp1 == cmp2
-    if cmp1 == "nil" or cmp2 == "nil":
+        return val1[0] == val2[0]
+    if val1[0] != val2[0]:
         raise_err(OperandsError)
+
+    if i_opcode in eq_instr_list:
+        return val1[1] == val2[1]
     elif i_opcode == "LT":
-        return cmp1 < cmp2
+        return val1[1] < val2[1]
     elif i_opcode == "GT":
-        return cmp1 > cmp2
+        return val1[1] > val2[1]
 
 
-def jump_if_eq_neq_eval(i_opcode, iip, i_label, symb1, symb1_type, symb2, symb2_type, eq_flag):
+def jump_if_eq_neq_eval(i_opcode, iip, target, symb1, symb1_type, symb2, symb2_type, eq_flag):
     """
     evaluates conditional jumps JUMPIFEQ, JUMPIFNEQ
 
     :param i_opcode: instruction opcode
     :param iip: internal instruction pointer
-    :param i_label: label to jump to
+    :param target: position of the label to jump to
     :param symb1: operator 1 to compare
     :param symb1_type: type of op1
     :param symb2: operator 2 to compare
@@ -889,221 +1819,1535 @@ def jump_if_eq_neq_eval(i_opcode, iip, i_label, symb1, symb1_type, symb2, symb2_
     :param eq_flag: differentiates between jump if EQ and NOT EQ
     :return: evaluation result
     """
-    global LD
-    if i_label.text not in LD:
-        raise_err(SemanticsError)
     eq = compare_values(i_opcode, symb1, symb1_type, symb2, symb2_type)
     if eq_flag:
         if eq:
-            return int(LD.get(i_label.text)) - 1
+            return target - 1
     else:
         if not eq:
-            return int(LD.get(i_label.text)) - 1
+            return target - 1
     return iip
 
 
-def three_arg_instructions_eval(instr, i_opcode, iip):
+def instr_arithmetic(instr, iip, executed_i):
+    """
+    processes instructions ADD, SUB, MUL, IDIV
     """
-    processes instructions that have three arguments
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    num = arithmetic_operations_eval(instr.opcode, arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, ("int", num))
+    return iip
 
-    :param instr: current instruction
-    :param i_opcode: instruction opcode
-    :param iip: internal instruction pointer
-    :return: None on failure
-    """
-    arg1 = instr[0]
-    arg2 = instr[1]
-    arg2_type = arg2.get("type")
-    arg3 = instr[2]
-    arg3_type = arg3.get("type")
-    if i_opcode in ["ADD", "SUB", "MUL", "IDIV", "LT", "GT", "EQ", "AND", "OR", "STRI2INT", "CONCAT", "GETCHAR"]:
-        check_is_var_defined(arg1)
-    if i_opcode in ["ADD", "SUB", "MUL", "IDIV"]:
-        num = arithmetic_operations_eval(i_opcode, arg2, arg2_type, arg3, arg3_type)
-        val = ["int", num]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode in ["LT", "GT", "EQ"]:
-        comparison = compare_values(i_opcode, arg2, arg2_type, arg3, arg3_type)
-        if not comparison:
-            comp_str = "false"
-        else:
-            comp_str = "true"
-        val = ["bool", comp_str]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode in ["AND", "OR"]:
-        bool_val = bool_operations_eval(i_opcode, arg2, arg2_type, arg3, arg3_type)
-        val = ["bool", bool_val]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "STRI2INT":
-        str_char = get_char_in_string_on_pos(arg2, arg2_type, arg3, arg3_type)
-        val = ["int", ord(str_char)]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "CONCAT":
-        s = concat_eval(arg2, arg2_type, arg3, arg3_type)
-        val = ["string", s]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "GETCHAR":
-        str_char = get_char_in_string_on_pos(arg2, arg2_type, arg3, arg3_type)
-        val = ["string", str_char]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "SETCHAR":
-        replaced = set_char_eval(arg1, arg2, arg2_type, arg3, arg3_type)
-        val = ["string", replaced]
-        get_or_update_var(arg1, val, True)
-    elif i_opcode == "JUMPIFEQ":
-        iip = jump_if_eq_neq_eval(i_opcode, iip, arg1, arg2, arg2_type, arg3, arg3_type, True)
-    elif i_opcode == "JUMPIFNEQ":
-        iip = jump_if_eq_neq_eval(i_opcode, iip, arg1, arg2, arg2_type, arg3, arg3_type, False)
-    else:
-        return None
+
+def instr_relational(instr, iip, executed_i):
+    """
+    processes instructions LT, GT, EQ
+    """
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    comparison = compare_values(instr.opcode, arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, TRUE if comparison else FALSE)
     return iip
 
 
-def count_instr(root):
-    count = 0
-    for _ in root:
-        count += 1
-    return count
+def instr_bool(instr, iip, executed_i):
+    """
+    processes instructions AND, OR
+    """
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    bool_val = bool_operations_eval(instr.opcode, arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, TRUE if bool_val else FALSE)
+    return iip
+
+
+def instr_stri2int(instr, iip, executed_i):
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    str_char = get_char_in_string_on_pos(arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, ("int", ord(str_char)))
+    return iip
+
+
+def instr_concat(instr, iip, executed_i):
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    s = concat_eval(arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, ("string", s))
+    return iip
+
+
+def instr_getchar(instr, iip, executed_i):
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    str_char = get_char_in_string_on_pos(arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, ("string", str_char))
+    return iip
+
+
+def instr_setchar(instr, iip, executed_i):
+    arg1, arg2, arg3 = instr.args
+    replaced = set_char_eval(arg1, arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, ("string", replaced))
+    return iip
+
 
+def instr_jumpifeq(instr, iip, executed_i):
+    _, arg2, arg3 = instr.args
+    return jump_if_eq_neq_eval(instr.opcode, iip, instr.target, arg2, arg2.type, arg3, arg3.type, True)
 
-def eval_instructions(root, input_file):
+
+def instr_jumpifneq(instr, iip, executed_i):
+    _, arg2, arg3 = instr.args
+    return jump_if_eq_neq_eval(instr.opcode, iip, instr.target, arg2, arg2.type, arg3, arg3.type, False)
+
+
+def pop_operand(val_type):
+    """
+    pops the operand of a stack instruction from the data stack
+
+    :param val_type: required type of the operand
+    :return: (native) value of the operand
+    """
+    if not DS:
+        raise_err(MissingValError)
+    val = DS.pop()
+    if val[0] != val_type:
+        raise_err(OperandsError)
+    return val[1]
+
+
+def pop_operands():
     """
-    evaluate all instructions in program (root)
+    pops both operands of a stack instruction from the data stack, the second one is on the top
 
-    :param root: main program composed of instructions
-    :param input_file: input file
+    :return: (operand 1, operand 2) as values
     """
+    if len(DS) < 2:
+        raise_err(MissingValError)
+    val2 = DS.pop()
+    return DS.pop(), val2
+
+
+def compare_stack_values(i_opcode, val1, val2):
+    """
+    compares values of two operands of a stack instruction depending on the opcode,
+    the same way as compare_values
+
+    :return: comparison of values depending on OPCODE
+    """
+    if val1[0] == "nil" or val2[0] == "nil":
+        if i_opcode not in eq_instr_list:
+            raise_err(OperandsError)
+        return val1[0] == val2[0]
+    if val1[0] != val2[0]:
+        raise_err(OperandsError)
+
+    if i_opcode in eq_instr_list:
+        return val1[1] == val2[1]
+    elif i_opcode == "LTS":
+        return val1[1] < val2[1]
+    elif i_opcode == "GTS":
+        return val1[1] > val2[1]
+
+
+def instr_clears(instr, iip, executed_i):
+    DS.clear()
+    return iip
+
+
+def instr_arithmetic_stack(instr, iip, executed_i):
+    """
+    processes instructions ADDS, SUBS, MULS, IDIVS
+    """
+    val1, val2 = pop_operands()
+    if val1[0] != "int" or val2[0] != "int":
+        raise_err(OperandsError)
+    i_opcode = instr.opcode
+    n1 = val1[1]
+    n2 = val2[1]
+    if i_opcode == "ADDS":
+        result = n1 + n2
+    elif i_opcode == "SUBS":
+        result = n1 - n2
+    elif i_opcode == "MULS":
+        result = n1 * n2
+    else:
+        if n2 == 0:
+            raise_err(OperandValError)
+        result = n1 // n2
+    DS.append(("int", result))
+    return iip
+
+
+def instr_relational_stack(instr, iip, executed_i):
+    """
+    processes instructions LTS, GTS, EQS
+    """
+    val1, val2 = pop_operands()
+    DS.append(TRUE if compare_stack_values(instr.opcode, val1, val2) else FALSE)
+    return iip
+
+
+def instr_bool_stack(instr, iip, executed_i):
+    """
+    processes instructions ANDS, ORS
+    """
+    val1, val2 = pop_operands()
+    if val1[0] != "bool" or val2[0] != "bool":
+        raise_err(OperandsError)
+    if instr.opcode == "ANDS":
+        bool_val = val1[1] and val2[1]
+    else:
+        bool_val = val1[1] or val2[1]
+    DS.append(TRUE if bool_val else FALSE)
+    return iip
+
+
+def instr_nots(instr, iip, executed_i):
+    DS.append(FALSE if pop_operand("bool") else TRUE)
+    return iip
+
+
+def instr_int2chars(instr, iip, executed_i):
+    max_ascii_val = 1114111
+    int_val = pop_operand("int")
+    if not (0 < int_val < max_ascii_val):
+        raise_err(StringError)
+    DS.append(("string", chr(int_val)))
+    return iip
+
+
+def instr_stri2ints(instr, iip, executed_i):
+    val1, val2 = pop_operands()
+    if val1[0] != "string" or val2[0] != "int":
+        raise_err(OperandsError)
+    arg_str = val1[1]
+    arg_pos = val2[1]
+    if 0 > arg_pos or arg_pos >= len(arg_str):
+        raise_err(StringError)
+    DS.append(("int", ord(arg_str[arg_pos])))
+    return iip
+
+
+def instr_jumpifeqs(instr, iip, executed_i):
+    val1, val2 = pop_operands()
+    if compare_stack_values(instr.opcode, val1, val2):
+        return instr.target - 1
+    return iip
+
+
+def instr_jumpifneqs(instr, iip, executed_i):
+    val1, val2 = pop_operands()
+    if not compare_stack_values(instr.opcode, val1, val2):
+        return instr.target - 1
+    return iip
+
+
+def instr_unknown(instr, iip, executed_i):
+    raise_err(SemanticsError)
+
+
+def instr_fused_relational_jump(instr, iip, executed_i):
+    """
+    processes instruction LT, GT or EQ fused with the following JUMPIFEQ/JUMPIFNEQ,
+    which compares the result with a bool constant (instr.fused is (target, jump if the result is))
+    """
+    global FUSED_STEPS
+    arg1, arg2, arg3 = instr.args
+    check_is_var_defined(arg1)
+    comparison = compare_values(instr.opcode, arg2, arg2.type, arg3, arg3.type)
+    set_var(arg1, TRUE if comparison else FALSE)
+    FUSED_STEPS += 1
+    target, jump_if = instr.fused
+    if comparison == jump_if:
+        return target - 1
+    return iip + 1
+
+
+def instr_fused_pushs_pops(instr, iip, executed_i):
+    """
+    processes instruction PUSHS fused with the following POPS (instr.fused is the argument of POPS)
+    """
+    global FUSED_STEPS
+    set_var(instr.fused, get_symb(instr.args[0]))
+    FUSED_STEPS += 1
+    return iip + 1
+
+
+def instr_fused_move_write(instr, iip, executed_i):
+    """
+    processes instruction MOVE fused with the following WRITE of the moved variable
+    """
+    global FUSED_STEPS
+    arg1, arg2 = instr.args
+    check_is_var_defined(arg1)
+    val = get_symb(arg2)
+    set_var(arg1, val)
+    OUT.write(value_to_str(val))
+    FUSED_STEPS += 1
+    return iip + 1
+
+
+# Handlers of fused instructions (see optimize_program)
+fused_handlers = (instr_fused_relational_jump, instr_fused_pushs_pops, instr_fused_move_write)
+
+# Instruction handlers - every handler takes the decoded instruction, internal instruction pointer and
+# number of executed instructions and returns the new internal instruction pointer
+instr_handlers = {
+    "CREATEFRAME": instr_createframe,
+    "PUSHFRAME": instr_pushframe,
+    "POPFRAME": instr_popframe,
+    "RETURN": instr_return,
+    "BREAK": instr_break,
+    "DEFVAR": instr_defvar,
+    "POPS": instr_pops,
+    "LABEL": instr_label,
+    "CALL": instr_call,
+    "JUMP": instr_jump,
+    "PUSHS": instr_pushs,
+    "WRITE": instr_write,
+    "EXIT": instr_exit,
+    "DPRINT": instr_dprint,
+    "MOVE": instr_move,
+    "INT2CHAR": instr_int2char,
+    "STRLEN": instr_strlen,
+    "TYPE": instr_type,
+    "NOT": instr_not,
+    "READ": instr_read,
+    "ADD": instr_arithmetic,
+    "SUB": instr_arithmetic,
+    "MUL": instr_arithmetic,
+    "IDIV": instr_arithmetic,
+    "LT": instr_relational,
+    "GT": instr_relational,
+    "EQ": instr_relational,
+    "AND": instr_bool,
+    "OR": instr_bool,
+    "CONCAT": instr_concat,
+    "GETCHAR": instr_getchar,
+    "SETCHAR": instr_setchar,
+    "STRI2INT": instr_stri2int,
+    "JUMPIFEQ": instr_jumpifeq,
+    "JUMPIFNEQ": instr_jumpifneq,
+    "CLEARS": instr_clears,
+    "ADDS": instr_arithmetic_stack,
+    "SUBS": instr_arithmetic_stack,
+    "MULS": instr_arithmetic_stack,
+    "IDIVS": instr_arithmetic_stack,
+    "LTS": instr_relational_stack,
+    "GTS": instr_relational_stack,
+    "EQS": instr_relational_stack,
+    "ANDS": instr_bool_stack,
+    "ORS": instr_bool_stack,
+    "NOTS": instr_nots,
+    "INT2CHARS": instr_int2chars,
+    "STRI2INTS": instr_stri2ints,
+    "JUMPIFEQS": instr_jumpifeqs,
+    "JUMPIFNEQS": instr_jumpifneqs,
+}
+
+
+def decode_instr(instr, opcode, order=None):
+    """
+    converts checked XML instruction into a decoded instruction,
+    so that the evaluation does not have to read XML attributes again
+
+    :param instr: XML instruction with sorted arguments
+    :param opcode: upper-cased opcode of the instruction
+    :param order: order of the instruction
+    :return: decoded instruction
+    """
+    args = tuple(Arg(arg.get("type"), arg.text) for arg in instr)
+    return Instruction(opcode, args, order)
+
+
+def eval_instructions(program, input_file):
+    """
+    evaluate all instructions in program
+
+    :param program: list of decoded instructions
+    :param input_file: input file (None means standard input)
+    :return: number of executed instructions
+    """
+    global IN, GF
+    GF = new_frame(GVS)
+    if input_file is None:
+        IN = InputReader(sys.stdin, strip=False, is_stdin=True)
+    else:
+        IN = InputReader(input_file)
+    # instrumented loops (they check the limits of the watchdog too),
+    # so that this one does not pay for profiling, statistics and limits
+    if PROF is not None:
+        return PROF.eval(program)
+    if STATS is not None:
+        return STATS.eval(program)
+    if WATCH is not None:
+        return WATCH.eval(program)
+    if COMPILE:
+        return eval_blocks(program)
     executed_i = -1  # number of executed instructions
     iip = 0  # internal instruction pointer
-    count = count_instr(root)
+    count = len(program)
     while iip < count:
         executed_i += 1
-        instr = root[iip]
-        i_opcode = instr.get("opcode").upper()
-        if i_opcode in zero_arg_instr_list:
-            iip = zero_arg_instructions_eval(i_opcode, iip, executed_i)
-        elif i_opcode in one_arg_instr_list:
-            iip = one_arg_instructions_eval(instr, i_opcode, iip)
-        elif i_opcode in two_arg_instr_list:
-            iip = two_arg_instructions_eval(instr, i_opcode, iip, input_file)
-        elif i_opcode in three_arg_instr_list:
-            iip = three_arg_instructions_eval(instr, i_opcode, iip)
+        instr = program[iip]
+        iip = instr.handler(instr, iip, executed_i) + 1
+    return executed_i + 1 + FUSED_STEPS
+
+
+def compile_operand(arg):
+    """
+    compiled instructions read their <symb> operands inline - a constant is kept in a list of its own,
+    so that constants and global variables (the global frame is bound directly) are read the same way:
+
+        val = source[index] if source is not None else get()
+
+    the value is UNDEF if the variable or its frame does not exist and None if the variable has no value yet
+
+    :param arg: <symb> argument
+    :return: (the global frame, a list with the constant, or None for a local or temporary variable;
+     index of the value in the list; function returning the value of a local or temporary variable)
+    """
+    if arg.type != "var":
+        return [arg.value], 0, None
+    if arg.frame == "GF":
+        return GF, arg.slot, None
+    slot = arg.slot
+    is_local = arg.frame == "LF"
+
+    def get_local():
+        frame = LF if is_local else TF
+        return frame[slot] if frame is not None else UNDEF
+    return None, None, get_local
+
+
+def compile_dest(arg):
+    """
+    compiled instructions find the frame of the variable they set inline too:
+
+        frame = global_frame or (LF if is_local else TF)
+
+    :param arg: argument of type "var"
+    :return: (the global frame if the variable is global, otherwise None - the global frame of a program
+     with global variables is never empty; True if the variable is local)
+    """
+    return (GF if arg.frame == "GF" else None), arg.frame == "LF"
+
+
+# A compiled instruction evaluates only valid operands - the frame of the variable it sets exists
+# and the variable is defined, its <symb> operands are values (tuples) of the required types.
+# Otherwise it calls the handler of the instruction, which reports the error the same as without --compile.
+
+def compile_move(instr, iip):
+    arg1, arg2 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source, index, get = compile_operand(arg2)
+    handler = instr_handlers[instr.opcode]
+
+    def move():
+        frame = global_frame or (LF if is_local else TF)
+        val = source[index] if source is not None else get()
+        if frame is not None and frame[slot] is not UNDEF and type(val) is tuple:
+            frame[slot] = val
         else:
-            raise_err(SemanticsError)
-        if iip is None:
-            raise_err(SemanticsError)
-        iip += 1
+            handler(instr, iip, None)
+    return move
+
+
+def compile_arithmetic(instr, iip):
+    """
+    compiles instructions ADD, SUB, MUL, IDIV
+    """
+    arg1, arg2, arg3 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    operation = arithmetic_operators.get(instr.opcode)
+    handler = instr_handlers[instr.opcode]
+
+    def arithmetic():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if (frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and val1[0] == "int"
+                and type(val2) is tuple and val2[0] == "int"):
+            if operation is not None:
+                frame[slot] = ("int", operation(val1[1], val2[1]))
+                return
+            if val2[1] != 0:
+                frame[slot] = ("int", val1[1] // val2[1])
+                return
+        handler(instr, iip, None)
+    return arithmetic
+
+
+def compile_relational(instr, iip):
+    """
+    compiles instructions LT, GT, EQ
+    """
+    arg1, arg2, arg3 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    compare = operator.lt if instr.opcode == "LT" else operator.gt
+    handler = instr_handlers[instr.opcode]
+
+    def eq():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and type(val2) is tuple:
+            if val1[0] == val2[0]:
+                frame[slot] = TRUE if val1[1] == val2[1] else FALSE
+                return
+            if val1[0] == "nil" or val2[0] == "nil":
+                frame[slot] = FALSE
+                return
+        handler(instr, iip, None)
+
+    def lt_gt():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if (frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and type(val2) is tuple
+                and val1[0] == val2[0] and val1[0] != "nil"):
+            frame[slot] = TRUE if compare(val1[1], val2[1]) else FALSE
+        else:
+            handler(instr, iip, None)
+    return eq if instr.opcode == "EQ" else lt_gt
+
+
+def compile_bool(instr, iip):
+    """
+    compiles instructions AND, OR
+    """
+    arg1, arg2, arg3 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    is_and = instr.opcode == "AND"
+    handler = instr_handlers[instr.opcode]
+
+    def bool_operation():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if (frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and val1[0] == "bool"
+                and type(val2) is tuple and val2[0] == "bool"):
+            if is_and:
+                frame[slot] = TRUE if val1[1] and val2[1] else FALSE
+            else:
+                frame[slot] = TRUE if val1[1] or val2[1] else FALSE
+        else:
+            handler(instr, iip, None)
+    return bool_operation
+
+
+def compile_not(instr, iip):
+    arg1, arg2 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source, index, get = compile_operand(arg2)
+    handler = instr_handlers[instr.opcode]
+
+    def not_operation():
+        frame = global_frame or (LF if is_local else TF)
+        val = source[index] if source is not None else get()
+        if frame is not None and frame[slot] is not UNDEF and type(val) is tuple and val[0] == "bool":
+            frame[slot] = FALSE if val[1] else TRUE
+        else:
+            handler(instr, iip, None)
+    return not_operation
+
+
+def compile_defvar(instr, iip):
+    arg = instr.args[0]
+    global_frame, is_local = compile_dest(arg)
+    slot = arg.slot
+    handler = instr_handlers[instr.opcode]
+
+    def defvar():
+        frame = global_frame or (LF if is_local else TF)
+        if frame is not None and frame[slot] is UNDEF:
+            frame[slot] = None
+        else:
+            handler(instr, iip, None)
+    return defvar
+
+
+def compile_strlen(instr, iip):
+    arg1, arg2 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source, index, get = compile_operand(arg2)
+    handler = instr_handlers[instr.opcode]
+
+    def strlen():
+        frame = global_frame or (LF if is_local else TF)
+        val = source[index] if source is not None else get()
+        if frame is not None and frame[slot] is not UNDEF and type(val) is tuple and val[0] == "string":
+            frame[slot] = ("int", len(val[1]))
+        else:
+            handler(instr, iip, None)
+    return strlen
+
+
+def compile_getchar(instr, iip):
+    """
+    compiles instructions GETCHAR, STRI2INT
+    """
+    arg1, arg2, arg3 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    is_getchar = instr.opcode == "GETCHAR"
+    handler = instr_handlers[instr.opcode]
+
+    def getchar():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if (frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and val1[0] == "string"
+                and type(val2) is tuple and val2[0] == "int" and 0 <= val2[1] < len(val1[1])):
+            if is_getchar:
+                frame[slot] = ("string", val1[1][val2[1]])
+            else:
+                frame[slot] = ("int", ord(val1[1][val2[1]]))
+        else:
+            handler(instr, iip, None)
+    return getchar
+
+
+def compile_concat(instr, iip):
+    arg1, arg2, arg3 = instr.args
+    global_frame, is_local = compile_dest(arg1)
+    slot = arg1.slot
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    handler = instr_handlers[instr.opcode]
+
+    def concat():
+        frame = global_frame or (LF if is_local else TF)
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if (frame is not None and frame[slot] is not UNDEF and type(val1) is tuple and val1[0] == "string"
+                and type(val2) is tuple and val2[0] == "string"):
+            frame[slot] = ("string", concat_strings(val1[1], str(val2[1])))
+        else:
+            handler(instr, iip, None)
+    return concat
+
+
+def compile_pushs(instr, iip):
+    source, index, get = compile_operand(instr.args[0])
+    handler = instr_handlers[instr.opcode]
+
+    def pushs():
+        val = source[index] if source is not None else get()
+        if type(val) is tuple:
+            DS.append(val)
+        else:
+            handler(instr, iip, None)
+    return pushs
+
+
+def compile_pops(instr, iip):
+    arg = instr.args[0]
+    global_frame, is_local = compile_dest(arg)
+    slot = arg.slot
+    handler = instr_handlers[instr.opcode]
+
+    def pops():
+        frame = global_frame or (LF if is_local else TF)
+        if DS and frame is not None and frame[slot] is not UNDEF:
+            frame[slot] = DS.pop()
+        else:
+            handler(instr, iip, None)
+    return pops
+
+
+def compile_write(instr, iip):
+    source, index, get = compile_operand(instr.args[0])
+    handler = instr_handlers[instr.opcode]
+
+    def write():
+        val = source[index] if source is not None else get()
+        if type(val) is tuple:
+            OUT.write(value_to_str(val))
+        else:
+            handler(instr, iip, None)
+    return write
+
+
+# Functions compiling instructions for eval_blocks - every one takes the decoded instruction and its position
+# and returns a function evaluating the instruction, other instructions are evaluated by their handlers
+compiled_instrs = {
+    "MOVE": compile_move,
+    "ADD": compile_arithmetic,
+    "SUB": compile_arithmetic,
+    "MUL": compile_arithmetic,
+    "IDIV": compile_arithmetic,
+    "LT": compile_relational,
+    "GT": compile_relational,
+    "EQ": compile_relational,
+    "AND": compile_bool,
+    "OR": compile_bool,
+    "NOT": compile_not,
+    "DEFVAR": compile_defvar,
+    "STRLEN": compile_strlen,
+    "GETCHAR": compile_getchar,
+    "STRI2INT": compile_getchar,
+    "CONCAT": compile_concat,
+    "PUSHS": compile_pushs,
+    "POPS": compile_pops,
+    "WRITE": compile_write,
+}
+
+
+def compile_jumpifeq(instr, iip):
+    """
+    compiles instructions JUMPIFEQ, JUMPIFNEQ
+    """
+    _, arg2, arg3 = instr.args
+    source1, index1, get1 = compile_operand(arg2)
+    source2, index2, get2 = compile_operand(arg3)
+    handler = instr_handlers[instr.opcode]
+    # positions of the next instruction when the values are equal and when they are not
+    if instr.opcode == "JUMPIFEQ":
+        if_eq, if_neq = instr.target, iip + 1
+    else:
+        if_eq, if_neq = iip + 1, instr.target
 
+    def jumpifeq(executed_i):
+        val1 = source1[index1] if source1 is not None else get1()
+        val2 = source2[index2] if source2 is not None else get2()
+        if type(val1) is tuple and type(val2) is tuple:
+            if val1[0] == val2[0]:
+                return if_eq if val1[1] == val2[1] else if_neq
+            if val1[0] == "nil" or val2[0] == "nil":
+                return if_neq
+        return handler(instr, iip, executed_i) + 1
+    return jumpifeq
 
-def sort_root(root):
+
+def compile_instr(instr, iip):
+    """
+    :return: function evaluating an instruction which does not end a basic block,
+     instructions which are not compiled are evaluated by their handlers
     """
-    sorts instructions in program (root)
+    compile_function = compiled_instrs.get(instr.opcode)
+    if compile_function is not None:
+        return compile_function(instr, iip)
+    handler = instr_handlers.get(instr.opcode, instr_unknown)
+    return lambda: handler(instr, iip, None)
+
 
-    :param root: main program composed of instructions
-    :return: sorted root
+def compile_block_end(instr, iip):
     """
-    has_vals = []
-    for i in root:
-        if type(i.get("order")) != str:
-            raise_err(UnexpectedXMLStructure)
-        if not (i.get("order").isdigit()):
-            raise_err(UnexpectedXMLStructure)
-        if int(i.get("order")) in has_vals or 0 in has_vals:
-            raise_err(UnexpectedXMLStructure)
-        has_vals.append(int(i.get("order")))
-    root[:] = sorted(root, key=lambda child: (child.tag, int(child.get('order'))))
-    # sorts arguments of instructions
-    for root_child in root:
-        root_child[:] = sorted(root_child, key=lambda x: x.tag)
-    return root
+    :return: function evaluating an instruction which ends a basic block - it takes the number
+     of executed instructions - 1 (same as handlers) and returns the position of the next instruction
+    """
+    if instr.opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+        return compile_jumpifeq(instr, iip)
+    handler = instr_handlers[instr.opcode]
+    return lambda executed_i: handler(instr, iip, executed_i) + 1
 
 
-def check_arg_sem(arg, type_to_check):
+def compile_block(program, start):
     """
-    checks semantics of an argument
+    compiles a basic block - instructions from the start up to the next label or up to an instruction
+    of block_end_instrs; a block is entered only at its start, because jumps go to labels
+    and RETURN goes after CALL
 
-    :param arg: argument to check value in
-    :param type_to_check: user-defined type to check
+    :param program: list of decoded instructions with resolved jump targets
+    :param start: position of the first instruction of the block
+    :return: (function evaluating the block, number of instructions of the block) - the function takes
+     the number of instructions executed before the block - 1 and returns the position of the next instruction
     """
-    arg_type = arg.get("type")
-    symb = var_types + ["var"]
-    if type_to_check == "symb":
-        if arg_type not in symb:
-            raise_err(XMLFormatError)
+    body = []
+    block_end = None
+    iip = start
+    count = len(program)
+    while iip < count:
+        instr = program[iip]
+        if instr.opcode == "LABEL":
+            if iip != start:
+                break
+        elif instr.opcode in block_end_instrs:
+            block_end = instr
+            break
+        else:
+            body.append(compile_instr(instr, iip))
+        iip += 1
+    body = tuple(body)
+    length = iip - start
+
+    if block_end is None:
+        # the block continues with the block on position iip
+        def run_block(executed_i):
+            for instr_function in body:
+                instr_function()
+            return iip
+    elif block_end.opcode == "JUMP":
+        target = block_end.target
+        length += 1
+
+        def run_block(executed_i):
+            for instr_function in body:
+                instr_function()
+            return target
     else:
-        if arg_type != type_to_check:
+        end_function = compile_block_end(block_end, iip)
+        length += 1
+
+        def run_block(executed_i):
+            for instr_function in body:
+                instr_function()
+            return end_function(executed_i + length)
+    return run_block, length
+
+
+def eval_block_by_handlers(program, start, executed_i):
+    """
+    evaluates a basic block (see compile_block) by handlers of its instructions, fused handlers
+    (see optimize_program) are not used, the same as in compiled blocks
+
+    :param program: list of decoded instructions with resolved jump targets
+    :param start: position of the first instruction of the block
+    :param executed_i: number of instructions executed before the block - 1
+    :return: (position of the next instruction, number of executed instructions - 1)
+    """
+    iip = start
+    count = len(program)
+    while iip < count:
+        instr = program[iip]
+        if instr.opcode == "LABEL" and iip != start:
+            break
+        executed_i += 1
+        handler = instr_handlers.get(instr.opcode, instr_unknown)
+        if instr.opcode in block_end_instrs:
+            return handler(instr, iip, executed_i) + 1, executed_i
+        iip = handler(instr, iip, executed_i) + 1
+    return iip, executed_i
+
+
+def eval_blocks(program):
+    """
+    evaluates the program by compiled basic blocks (--compile) - every instruction of a block is compiled
+    into a closure with its operands already bound, so the loop dispatches only whole blocks; a block
+    is compiled when it is entered for the second time (the first time it is evaluated by handlers),
+    because compiling takes longer than evaluating code which runs only once
+
+    :param program: list of decoded instructions
+    :return: number of executed instructions
+    """
+    count = len(program)
+    blocks = [None] * count  # None - the block was not entered yet, False - it was entered once
+    executed_i = -1
+    iip = 0
+    while iip < count:
+        block = blocks[iip]
+        if block is None:
+            blocks[iip] = False
+            iip, executed_i = eval_block_by_handlers(program, iip, executed_i)
+            continue
+        if block is False:
+            block = blocks[iip] = compile_block(program, iip)
+        run_block, length = block
+        iip = run_block(executed_i)
+        executed_i += length
+    return executed_i + 1 + FUSED_STEPS
+
+
+def check_order(instr, orders):
+    """
+    checks the order attribute of an instruction
+
+    :param instr: XML instruction
+    :param orders: set of orders of already checked instructions
+    :return: order of the instruction (positive integer)
+    """
+    order = instr.get("order")
+    if order is None or not order.isdecimal():
+        raise_err(UnexpectedXMLStructure)
+    order = int(order)
+    if order == 0 or order in orders:
+        raise_err(UnexpectedXMLStructure)
+    orders.add(order)
+    return order
+
+
+def sort_program(program, orders):
+    """
+    sorts instructions by their order - if the orders form a contiguous sequence (e.g. 1..n),
+    every instruction is placed directly on its position, otherwise the instructions are sorted
+
+    :param program: list of (order, decoded instruction) pairs
+    :param orders: set of orders of all instructions in the source
+    :return: list of decoded instructions sorted by their order
+    """
+    if not program:
+        return []
+    first = min(orders)
+    if len(program) == len(orders) and max(orders) - first + 1 == len(orders):
+        placed = [None] * len(program)
+        for order, instr in program:
+            placed[order - first] = instr
+        return placed
+    program.sort(key=lambda pair: pair[0])
+    return [instr for _, instr in program]
+
+
+def check_instr_sem(instr, signature):
+    """
+    checks semantics of an instruction - XML types of its arguments against the kinds
+    of operands in the signature of the instruction
+
+    :param instr: XML instruction with sorted arguments
+    :param signature: signature of the instruction (see instr_signatures)
+    """
+    for i, kind in enumerate(signature):
+        allowed = operand_types.get(kind)
+        if allowed is None:
+            continue
+        if len(instr) <= i:
+            raise_err(UnexpectedXMLStructure)
+        if instr[i].get("type") not in allowed:
             raise_err(XMLFormatError)
 
 
-def semantics_check(root):
+def record_load_err(load_errs, check, key, err):
+    """
+    remembers an error found while loading the program - for every check only the error
+    of the first instruction (by key) is kept
+
+    :param load_errs: dictionary of errors {check: (key, error)}
+    :param check: name of the check which found the error
+    :param key: position of the instruction the check goes by
+    :param err: raised error
+    """
+    if check not in load_errs or key < load_errs[check][0]:
+        load_errs[check] = (key, err)
+
+
+def load_instr(instr, position, orders, load_errs, program):
     """
-    checks correctness of semantics in program (root)
+    checks one XML instruction and appends its decoded form into the program
 
-    :param root: main program composed of instructions
+    :param instr: XML instruction (child of the root element)
+    :param position: position of the instruction in the source file
+    :param orders: set of orders of already checked instructions
+    :param load_errs: dictionary of errors found so far
+    :param program: list of (order, decoded instruction) pairs
     """
-    for instr in root:
-        i_opcode = instr.get("opcode")
-        if i_opcode is None:
+    try:
+        order = check_order(instr, orders)
+    except UnexpectedXMLStructure as e:
+        record_load_err(load_errs, "order", position, e)
+        return
+    key = (instr.tag, order)
+    if len(instr) > 1:
+        instr[:] = sorted(instr, key=lambda x: x.tag)
+    opcode = instr.get("opcode")
+    signature = arity = None
+    try:
+        if opcode is None:
             raise_err(UnexpectedXMLStructure)
-        i_opcode = i_opcode.upper()
-        var_fst_arg = ["MOVE", "DEFVAR", "POPS", "ADD", "SUB", "MUL", "IDIV", "LT", "GT", "EQ", "AND", "OR", "NOT",
-                       "INT2CHAR", "STRI2INT", "READ", "CONCAT", "STRLEN", "GETCHAR", "SETCHAR", "TYPE"]
-        label_fst_arg = ["CALL", "LABEL", "JUMP", "JUMPIFEQ", "JUMPIFNEQ"]
-        symb_fst_arg = ["WRITE", "EXIT", "DPRINT"]
-        not_symb_snd_arg = zero_arg_instr_list + one_arg_instr_list + ["READ"]
-        if i_opcode in var_fst_arg + label_fst_arg + symb_fst_arg:
-            if len(instr) < 1:
-                raise_err(UnexpectedXMLStructure)
-        if i_opcode in var_fst_arg:
-            check_arg_sem(instr[0], "var")
-        elif i_opcode in label_fst_arg:
-            check_arg_sem(instr[0], "label")
-        elif i_opcode in symb_fst_arg:
-            check_arg_sem(instr[0], "symb")
-        if i_opcode not in not_symb_snd_arg:
-            if len(instr) < 2:
-                raise_err(UnexpectedXMLStructure)
-            check_arg_sem(instr[1], "symb")
-        if i_opcode in three_arg_instr_list:
-            if len(instr) < 3:
-                raise_err(UnexpectedXMLStructure)
-            check_arg_sem(instr[2], "symb")
+        opcode = opcode.upper()
+        signature = instr_signatures.get(opcode)
+        if signature is None:
+            signature = unknown_instr_signature
+        else:
+            arity = len(signature)
+        check_instr_sem(instr, signature)
+    except (UnexpectedXMLStructure, XMLFormatError) as e:
+        record_load_err(load_errs, "semantics", key, e)
+        return
+    # the instruction is decoded even with wrong XML structure, its label is needed by the label check
+    try:
+        check_instr_xml(instr, arity)
+    except UnexpectedXMLStructure as e:
+        record_load_err(load_errs, "structure", key, e)
+    try:
+        program.append((order, decode_instr(instr, opcode, order)))
+    except UnexpectedXMLStructure as e:
+        record_load_err(load_errs, "structure", key, e)
+
+
+def load_program(src):
+    """
+    loads program from XML source - the source is parsed as a stream (iterparse) and every instruction
+    is checked and decoded as soon as it is read, after that its XML element is thrown away, so the whole
+    XML tree is never kept in memory
+
+    errors are reported in the same priority as if the checks were run one after another
+    over the whole program: well-formedness (31), order of instructions, semantics of arguments,
+    labels, root element and finally XML structure of instructions; jumps to undefined labels (52)
+    are reported only when the whole XML input is correct
+
+    :param src: source file (name or file object)
+    :return: list of decoded instructions sorted by their order
+    """
+    load_errs = {}
+    orders = set()
+    program = []
+    root = None
+    pending = None  # instruction is checked when its tail is known - after the next element starts
+    position = 0
+    depth = 0
+    # imported only when needed, --loader=expat does not need ElementTree and its import slows down the start
+    import xml.etree.ElementTree as Xml
+    try:
+        for event, elem in Xml.iterparse(src, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = elem
+                elif depth == 2 and pending is not None:
+                    load_instr(pending, position, orders, load_errs, program)
+                    root.remove(pending)
+                    pending = None
+                    position += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    pending = elem
+    except Xml.ParseError as e:
+        raise XMLFormatError(e.args[0])
+    if pending is not None:
+        load_instr(pending, position, orders, load_errs, program)
+        root.remove(pending)
+    return finish_program(program, orders, root, load_errs)
+
+
+def finish_program(program, orders, root, load_errs):
+    """
+    raises errors found while loading instructions (in their priority, see load_program), sorts
+    the instructions and resolves their labels and variables
+
+    :param program: list of (order, decoded instruction) pairs
+    :param orders: set of orders of all instructions
+    :param root: root element of the XML source
+    :param load_errs: dictionary of errors found while loading instructions
+    :return: list of decoded instructions sorted by their order
+    """
+    if "order" in load_errs:
+        raise load_errs["order"][1]
+    if "semantics" in load_errs:
+        raise load_errs["semantics"][1]
+    program = sort_program(program, orders)
+    fill_label_dict_with_labels(program)
+    check_root_attrib(root)
+    if "structure" in load_errs:
+        raise load_errs["structure"][1]
+    resolve_jump_targets(program)
+    assign_var_slots(program)
+    return program
+
+
+class XmlNode(list):
+    """
+    element of the XML source read by load_program_expat() - a list of its child elements with only what
+    the checks of instructions use from ElementTree elements (tag, attrib, text, tail and get())
+    """
+    __slots__ = ("tag", "attrib", "text", "tail", "get")
+
+    def __init__(self, tag, attrib):
+        super().__init__()
+        self.tag = tag
+        self.attrib = attrib
+        self.text = None
+        self.tail = None
+        self.get = attrib.get
+
+
+def load_program_expat(src):
+    """
+    loads program from XML source the same way as load_program() does (with the same errors in the same
+    priority), but instructions are assembled directly by callbacks of the expat parser, so no ElementTree
+    elements are built
+
+    :param src: source file (name or file object)
+    :return: list of decoded instructions sorted by their order
+    """
+    load_errs = {}
+    orders = set()
+    program = []
+    root = None
+    pending = None  # instruction is checked when its tail is known - after the next element starts
+    position = 0
+    open_elems = []
+    data = []  # character data since the last start or end of an element
+    last = None  # element which gets the character data as its text, or as its tail when is_tail is True
+    is_tail = False
+
+    def start_element(tag, attrib):
+        nonlocal root, pending, position, last, is_tail
+        if data:
+            if is_tail:
+                last.tail = "".join(data)
+            else:
+                last.text = "".join(data)
+            data.clear()
+        if "}" in tag:  # namespaced tag, named the same way as by ElementTree
+            tag = "{" + tag
+        last = elem = XmlNode(tag, attrib)
+        is_tail = False
+        depth = len(open_elems)
+        open_elems.append(elem)
+        if depth > 1:
+            open_elems[depth - 1].append(elem)
+        elif depth == 1:
+            if pending is not None:
+                load_instr(pending, position, orders, load_errs, program)
+                pending = None
+                position += 1
+        else:
+            root = elem
+
+    def end_element(tag):
+        nonlocal pending, last, is_tail
+        if data:
+            if is_tail:
+                last.tail = "".join(data)
+            else:
+                last.text = "".join(data)
+            data.clear()
+        last = open_elems.pop()
+        is_tail = True
+        if len(open_elems) == 1:
+            pending = last
+
+    parser = expat.ParserCreate(None, "}")
+    parser.buffer_text = True
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = data.append
+    try:
+        if isinstance(src, str):
+            with open(src, "rb") as f:
+                parser.ParseFile(f)
+        else:
+            parser.ParseFile(src)
+    except expat.ExpatError as e:
+        raise XMLFormatError(str(e))
+    if pending is not None:
+        load_instr(pending, position, orders, load_errs, program)
+    return finish_program(program, orders, root, load_errs)
+
+
+def pack_program(program):
+    """
+    converts a loaded program and its tables into a compact binary form (see DiskProgramCache) -
+    equal arguments (e.g. the same variable used by many instructions) are stored only once
+
+    :param program: list of decoded instructions
+    :return: bytes
+    """
+    args = {}
+    instrs = []
+    for instr in program:
+        indexes = tuple(args.setdefault(tuple(getattr(arg, name) for name in Arg.__slots__), len(args))
+                        for arg in instr.args)
+        instrs.append((instr.opcode, instr.order, instr.target, indexes))
+    return marshal.dumps((program_cache_format, tuple(args), instrs) + get_program_tables())
+
+
+def unpack_program(data):
+    """
+    converts a program packed by pack_program() back into decoded instructions and sets its tables,
+    instructions share equal arguments (they are never changed after the program is loaded)
+
+    :param data: bytes
+    :return: list of decoded instructions
+    """
+    packed = marshal.loads(data)
+    if type(packed) is not tuple or len(packed) != 6 or packed[0] != program_cache_format:
+        raise ValueError("unknown format of a cached program")
+    args = []
+    for fields in packed[1]:
+        arg = Arg.__new__(Arg)
+        arg.type, arg.text, arg.frame, arg.name, arg.slot, arg.value = fields
+        args.append(arg)
+    program = []
+    for opcode, order, target, indexes in packed[2]:
+        instr = Instruction(opcode, tuple([args[i] for i in indexes]), order)
+        instr.target = target
+        program.append(instr)
+    set_program_tables(packed[3:])
+    return program
+
+
+def get_program_tables():
+    """
+    :return: globals which describe the loaded program (labels and variable slots), reset_state() throws them away
+    """
+    return LD, GVS, LVS
+
+
+def set_program_tables(tables):
+    """
+    restores globals which describe a loaded program
+
+    :param tables: tables returned by get_program_tables()
+    """
+    global LD, GVS, LVS
+    LD, GVS, LVS = tables
+
+
+def execute(program, input_file):
+    """
+    evaluates loaded program and writes its statistics
+
+    :param program: list of decoded instructions
+    :param input_file: input file (None means standard input)
+    :return: return code of the program (0, or the value of instruction EXIT)
+    """
+    try:
+        eval_instructions(program, input_file)
+        rc = 0
+    except ProgramExit as e:  # instruction EXIT ends the interpretation successfully as well
+        rc = e.args[0]
+    if STATS is not None:
+        STATS.write()
+    return rc
 
 
 def run():
     """
     checks semantics of input XML structure and executes
     program instructions in correct order
-    """
-    src, inp = handle_args()
-    tree = Xml.parse(src)
-    root = tree.getroot()
-    root = sort_root(root)
+
+    :return: return code of the program
+    """
+    global OUT, PROF, STATS, WATCH, COMPILE
+    params = handle_args(sys.argv[1:])
+    if params.daemon is not None:
+        serve_daemon(params)
+        return 0
+    reset_state()
+    COMPILE = params.compile
+    if params.max_steps is not None or params.timeout is not None:
+        WATCH = Watchdog(params.max_steps, params.timeout, params.dump_on_limit)
+    try:
+        if params.profile is not None:
+            PROF = Profiler(open(params.profile, "w", encoding="utf-8"), params.profile_top)
+        if params.stats is not None:
+            STATS = Stats(open(params.stats, "w", encoding="utf-8"), params.stats_list)
+    except OSError:
+        raise_err(FileWriteError)
+    if params.binary_output:
+        OUT = OutputWriter(sys.stdout.buffer, params.output_buffer, True)
+    else:
+        OUT = OutputWriter(sys.stdout, params.output_buffer)
+    loader = load_program_expat if params.loader == "expat" else load_program
+    if params.cache_dir is not None:
+        if params.src is not None:
+            with open(params.src, "rb") as f:
+                source = f.read()
+        else:
+            source = sys.stdin.buffer.read()
+        program = DiskProgramCache(params.cache_dir, params.cache_size, loader).load(source)
+    else:
+        program = loader(params.src if params.src is not None else sys.stdin.buffer)
+    if params.optimize:
+        fusions = optimize_program(program)
+        print("Applied fusions: {0}".format(fusions), file=sys.stderr)
 
     input_file = None
-    if inp is not None:
-        input_file = open(inp, "r")
+    if params.inp is not None:
+        input_file = open(params.inp, "r")
 
-    semantics_check(root)
-    fill_label_dict_with_labels(root)
-    check_root_attrib(root)
-    check_instr_xml(root)
-    eval_instructions(root, input_file)
+    rc = execute(program, input_file)
 
     if input_file is not None:
         input_file.close()
+    return rc
+
+
+def sha256_hex(data):
+    """
+    :return: SHA-256 hash of data (bytes) as a hexadecimal string, programs in caches are stored by it
+    """
+    import hashlib  # only the caches need hashlib, its import would slow down the start of the interpreter
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiskProgramCache:
+    """
+    checked and decoded programs stored in a directory (--cache-dir), one file per program named by
+    SHA-256 hash of the interpreter and of the program source - a changed interpreter never reads programs
+    cached by another version; when there are too many files, the least recently used ones are removed
+    """
+
+    def __init__(self, directory, size=None, loader=None):
+        """
+        :param directory: cache directory (created if it does not exist)
+        :param size: maximal number of programs in the directory (default 256)
+        :param loader: function which loads programs missing in the cache (default load_program)
+        """
+        self.directory = directory
+        self.size = size or 256
+        self.loader = loader or load_program
+        with open(os.path.abspath(__file__), "rb") as f:
+            self.version = sha256_hex(sys.version.encode() + f.read()).encode()
+
+    def path(self, source):
+        """
+        :return: path of the cache file of a program source
+        """
+        return os.path.join(self.directory, sha256_hex(self.version + source) + ".ippc")
+
+    def load(self, source):
+        """
+        loads a program from the cache, if it is not there, the source is loaded and checked (see load_program)
+        and the program is stored in the cache - a cache which can not be read or written is ignored
+
+        :param source: XML source of the program as bytes
+        :return: list of decoded instructions
+        """
+        path = self.path(source)
+        try:
+            with open(path, "rb") as f:
+                program = unpack_program(f.read())
+        except (OSError, EOFError, ValueError, TypeError):  # not cached yet, damaged or removed meanwhile
+            program = None
+        if program is not None:
+            try:
+                os.utime(path)  # modification time of the file decides which programs are removed
+            except OSError:
+                pass
+            return program
+        program = self.loader(io.BytesIO(source))
+        try:
+            self.store(path, pack_program(program))
+        except OSError:
+            pass
+        return program
+
+    def store(self, path, data):
+        """
+        writes a cache file atomically (other interpreters may read the cache at the same time)
+        and removes the least recently used files above the size of the cache
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".ippc")]
+        if len(files) <= self.size:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.size]:
+            try:
+                os.unlink(entry.path)
+            except OSError:  # removed by another interpreter
+                pass
+
+
+class ProgramCache:
+    """
+    loaded programs of the daemon by SHA-256 hash of their source - when the cache is full,
+    the least recently used program is thrown away
+    """
+
+    def __init__(self, size=256, optimize=False, disk=None, loader=None):
+        """
+        :param size: maximal number of programs in the cache
+        :param optimize: if True, loaded programs are optimized (see optimize_program)
+        :param disk: cache directory used for programs which are not in the memory (DiskProgramCache)
+        :param loader: function which loads programs missing in the cache (default load_program)
+        """
+        self.size = size
+        self.optimize = optimize
+        self.disk = disk
+        self.loader = loader or load_program
+        self.programs = OrderedDict()
+
+    def load(self, source):
+        """
+        loads a program (from the cache if possible) and sets its labels and variable slots
+
+        :param source: XML source of the program as bytes
+        :return: list of decoded instructions
+        """
+        key = sha256_hex(source)
+        if key in self.programs:
+            self.programs.move_to_end(key)
+            program, tables = self.programs[key]
+            set_program_tables(tables)
+            return program
+        if self.disk is not None:
+            program = self.disk.load(source)
+        else:
+            program = self.loader(io.BytesIO(source))
+        if self.optimize:
+            optimize_program(program)
+        self.programs[key] = (program, get_program_tables())
+        if len(self.programs) > self.size:
+            self.programs.popitem(last=False)
+        return program
+
+
+# errors which end the interpretation with their own return code (see error_code)
+interpreter_errors = (ParamsError, FileOpenError, FileNotFoundError, FileWriteError, XMLFormatError,
+                      UnexpectedXMLStructure, SemanticsError, OperandsError, NonexistentVarError,
+                      NonexistentFrameError, MissingValError, OperandValError, StringError, LimitError,
+                      InternalError)
+
+
+def run_job(source, input_text, params, cache):
+    """
+    interprets one program of the daemon in a fresh interpreter state, the program output
+    and error output are collected instead of being written
+
+    :param source: XML source of the program as bytes
+    :param input_text: input of the program
+    :param params: parameters of the daemon
+    :param cache: cache of loaded programs
+    :return: (standard output, standard error output, return code)
+    """
+    global OUT, WATCH, COMPILE
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    with contextlib.redirect_stderr(stderr):
+        reset_state()
+        OUT = OutputWriter(stdout, params.output_buffer)
+        COMPILE = params.compile
+        if params.max_steps is not None or params.timeout is not None:
+            WATCH = Watchdog(params.max_steps, params.timeout, params.dump_on_limit)
+        try:
+            program = cache.load(source)
+            rc = execute(program, io.StringIO(input_text))
+        except interpreter_errors as e:
+            print("Error: {0}".format(e.args[0] if e.args else ""), file=sys.stderr)
+            rc = error_code(type(e))
+        except Exception as e:  # the daemon has to survive errors of the interpreter itself
+            print("Error: internal program error ({0!r})".format(e), file=sys.stderr)
+            rc = error_code(InternalError)
+        finally:
+            OUT.flush()
+    return stdout.getvalue(), stderr.getvalue(), rc
+
+
+def handle_request(line, params, cache):
+    """
+    runs one job of the daemon
+
+    :param line: JSON object of the job (see print_help)
+    :return: JSON object of the result
+    """
+    try:
+        job = json.loads(line)
+        source = job.get("source")
+        if source is not None:
+            source = source.encode("utf-8")
+        else:
+            with open(job["source_file"], "rb") as f:
+                source = f.read()
+        input_text = job.get("input")
+        if input_text is None and job.get("input_file") is not None:
+            with open(job["input_file"], "r", encoding="utf-8") as f:
+                input_text = f.read()
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return json.dumps({"id": None, "stdout": "", "stderr": "Error: invalid job\n",
+                           "rc": error_code(ParamsError)})
+    except OSError:
+        return json.dumps({"id": job.get("id"), "stdout": "", "stderr": "Error: couldn't open input files\n",
+                           "rc": error_code(FileOpenError)})
+    stdout, stderr, rc = run_job(source, input_text or "", params, cache)
+    return json.dumps({"id": job.get("id"), "stdout": stdout, "stderr": stderr, "rc": rc})
+
+
+def serve_stream(reader, writer, params, cache):
+    """
+    runs jobs read line by line from the reader and writes their results into the writer
+    """
+    for line in reader:
+        if line.strip():
+            writer.write(handle_request(line, params, cache) + "\n")
+            writer.flush()
+
+
+def serve_daemon(params):
+    """
+    runs the interpreter as a daemon (--daemon) - jobs are read from standard input,
+    or from connections to a Unix socket (one connection after another)
+
+    :param params: parameters of the daemon
+    """
+    loader = load_program_expat if params.loader == "expat" else load_program
+    disk = None
+    if params.cache_dir is not None:
+        disk = DiskProgramCache(params.cache_dir, params.cache_size, loader)
+    cache = ProgramCache(optimize=params.optimize, disk=disk, loader=loader)
+    if params.daemon == "":
+        serve_stream(sys.stdin, sys.stdout, params, cache)
+        return
+    try:
+        mode = os.lstat(params.daemon).st_mode
+    except FileNotFoundError:
+        mode = None
+    except OSError:
+        raise_err(FileWriteError)
+    if mode is not None:
+        # only a socket left by an earlier daemon is removed, never a file given by mistake
+        if not stat.S_ISSOCK(mode):
+            raise_err(FileWriteError)
+        try:
+            os.unlink(params.daemon)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            raise_err(FileWriteError)
+    import socket  # only the daemon listening on a socket needs the module
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    bound = False
+    try:
+        try:
+            server.bind(params.daemon)
+            bound = True
+            server.listen()
+        except OSError:
+            raise_err(FileWriteError)
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as reader, \
+                    conn.makefile("w", encoding="utf-8") as writer:
+                try:
+                    serve_stream(reader, writer, params, cache)
+                except OSError:  # client went away
+                    pass
+    finally:
+        server.close()
+        if bound:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(params.daemon)
 
 
 def catch_exceptions_and_launch():
     """
-    runs the program and catches any error exceptions along the way
+    runs the program and catches any error exceptions along the way,
+    the program output is flushed however the program ends
     """
+    rc = 0
     try:
-        run()
+        rc = run()
     except SemanticsError as e:
         exit_err(SemanticsError, e.args[0])
-    except Xml.ParseError as e:
-        exit_err(XMLFormatError, e.args[0])
     except XMLFormatError as e:
         exit_err(XMLFormatError, e.args[0])
     except MissingValError as e:
@@ -1124,6 +3368,17 @@ def catch_exceptions_and_launch():
         exit_err(OperandValError, e.args[0])
     except StringError as e:
         exit_err(StringError, e.args[0])
-
-
-catch_exceptions_and_launch()
+    except FileWriteError as e:
+        exit_err(FileWriteError, e.args[0])
+    except LimitError as e:
+        exit_err(LimitError, e.args[0])
+    finally:
+        if OUT is not None:
+            OUT.flush()
+        if PROF is not None:
+            PROF.write()
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    catch_exceptions_and_launch()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#######################################
+# Tests of interpret.py run in        #
+# separate processes                  #
+#######################################
+
+"""
+Tests of behaviour which the test corpus in both/ cannot check (standard input given through a pipe
+while the program runs, parameters of the interpreter). Every test runs interpret.py in a separate process.
+
+    python3 -m unittest discover tests
+"""
+
+import glob
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INTERPRETER = os.path.join(REPO_DIR, "interpret.py")
+
+# writes every line of the input back until the end of the input
+ECHO_PROGRAM = """<?xml version="1.0" encoding="UTF-8"?>
+<program language="IPPcode22">
+  <instruction order="1" opcode="DEFVAR"><arg1 type="var">GF@line</arg1></instruction>
+  <instruction order="2" opcode="LABEL"><arg1 type="label">loop</arg1></instruction>
+  <instruction order="3" opcode="READ"><arg1 type="var">GF@line</arg1><arg2 type="type">string</arg2></instruction>
+  <instruction order="4" opcode="JUMPIFEQ">
+    <arg1 type="label">end</arg1><arg2 type="var">GF@line</arg2><arg3 type="nil">nil</arg3>
+  </instruction>
+  <instruction order="5" opcode="WRITE"><arg1 type="var">GF@line</arg1></instruction>
+  <instruction order="6" opcode="WRITE"><arg1 type="string">\\010</arg1></instruction>
+  <instruction order="7" opcode="JUMP"><arg1 type="label">loop</arg1></instruction>
+  <instruction order="8" opcode="LABEL"><arg1 type="label">end</arg1></instruction>
+</program>
+"""
+
+# writes numbers 1 to 4 - every loop runs instructions fused by --optimize (MOVE and WRITE, PUSHS and POPS,
+# LT and JUMPIFEQ)
+COUNT_PROGRAM = """<?xml version="1.0" encoding="UTF-8"?>
+<program language="IPPcode22">
+  <instruction order="1" opcode="DEFVAR"><arg1 type="var">GF@i</arg1></instruction>
+  <instruction order="2" opcode="DEFVAR"><arg1 type="var">GF@x</arg1></instruction>
+  <instruction order="3" opcode="DEFVAR"><arg1 type="var">GF@b</arg1></instruction>
+  <instruction order="4" opcode="MOVE"><arg1 type="var">GF@i</arg1><arg2 type="int">1</arg2></instruction>
+  <instruction order="5" opcode="LABEL"><arg1 type="label">loop</arg1></instruction>
+  <instruction order="6" opcode="MOVE"><arg1 type="var">GF@x</arg1><arg2 type="var">GF@i</arg2></instruction>
+  <instruction order="7" opcode="WRITE"><arg1 type="var">GF@x</arg1></instruction>
+  <instruction order="8" opcode="PUSHS"><arg1 type="var">GF@i</arg1></instruction>
+  <instruction order="9" opcode="POPS"><arg1 type="var">GF@x</arg1></instruction>
+  <instruction order="10" opcode="ADD">
+    <arg1 type="var">GF@i</arg1><arg2 type="var">GF@x</arg2><arg3 type="int">1</arg3>
+  </instruction>
+  <instruction order="11" opcode="LT">
+    <arg1 type="var">GF@b</arg1><arg2 type="var">GF@i</arg2><arg3 type="int">5</arg3>
+  </instruction>
+  <instruction order="12" opcode="JUMPIFEQ">
+    <arg1 type="label">loop</arg1><arg2 type="var">GF@b</arg2><arg3 type="bool">true</arg3>
+  </instruction>
+</program>
+"""
+
+# CONCAT makes a string long enough to be a StrBuf (str_buf_min_len characters), MOVE copies it
+# and SETCHAR and CONCAT make new values from both copies
+SHARED_STRING_PROGRAM = """<?xml version="1.0" encoding="UTF-8"?>
+<program language="IPPcode22">
+  <instruction order="1" opcode="DEFVAR"><arg1 type="var">GF@a</arg1></instruction>
+  <instruction order="2" opcode="DEFVAR"><arg1 type="var">GF@b</arg1></instruction>
+  <instruction order="3" opcode="DEFVAR"><arg1 type="var">GF@c</arg1></instruction>
+  <instruction order="4" opcode="CONCAT">
+    <arg1 type="var">GF@a</arg1><arg2 type="string">{0}</arg2><arg3 type="string">b</arg3>
+  </instruction>
+  <instruction order="5" opcode="MOVE"><arg1 type="var">GF@b</arg1><arg2 type="var">GF@a</arg2></instruction>
+  <instruction order="6" opcode="SETCHAR">
+    <arg1 type="var">GF@b</arg1><arg2 type="int">0</arg2><arg3 type="string">c</arg3>
+  </instruction>
+  <instruction order="7" opcode="CONCAT">
+    <arg1 type="var">GF@c</arg1><arg2 type="var">GF@a</arg2><arg3 type="string">d</arg3>
+  </instruction>
+  <instruction order="8" opcode="SETCHAR">
+    <arg1 type="var">GF@a</arg1><arg2 type="int">1</arg2><arg3 type="string">e</arg3>
+  </instruction>
+  <instruction order="9" opcode="WRITE"><arg1 type="var">GF@a</arg1></instruction>
+  <instruction order="10" opcode="WRITE"><arg1 type="string">\\010</arg1></instruction>
+  <instruction order="11" opcode="WRITE"><arg1 type="var">GF@b</arg1></instruction>
+  <instruction order="12" opcode="WRITE"><arg1 type="string">\\010</arg1></instruction>
+  <instruction order="13" opcode="WRITE"><arg1 type="var">GF@c</arg1></instruction>
+</program>
+""".format("a" * 255)
+
+
+def run_interpreter(source, *options, input_path=os.devnull):
+    """
+    :return: (return code, standard output, standard error output) of the interpreter
+    """
+    process = subprocess.run([sys.executable, INTERPRETER, "--source=" + source, "--input=" + input_path]
+                             + list(options), capture_output=True, timeout=60)
+    return process.returncode, process.stdout, process.stderr
+
+
+def write_program(directory, xml):
+    """
+    :return: path of a new file with the program
+    """
+    path = os.path.join(directory, "program.xml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(xml)
+    return path
+
+
+class PipedInputTest(unittest.TestCase):
+    """
+    standard input given through a pipe is read as soon as a line arrives, not at the end of the input
+    """
+
+    def test_line_answered_before_end_of_input(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = write_program(tmp_dir, ECHO_PROGRAM)
+            process = subprocess.Popen([sys.executable, INTERPRETER, "--source=" + source],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            answers = queue.Queue()
+            reader = threading.Thread(target=lambda: [answers.put(line) for line in process.stdout], daemon=True)
+            reader.start()
+            try:
+                for line in (b"first", "druh\xfd".encode("utf-8")):
+                    process.stdin.write(line + b"\n")
+                    process.stdin.flush()
+                    self.assertEqual(answers.get(timeout=10), line + b"\n")
+            finally:
+                process.stdin.close()
+                process.wait(timeout=10)
+            self.assertEqual(process.returncode, 0)
+
+
+class MaxStepsTest(unittest.TestCase):
+    """
+    --max-steps stops the program after the same instruction with and without --optimize
+    """
+
+    def test_every_limit_same_with_optimize(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = write_program(tmp_dir, COUNT_PROGRAM)
+            max_steps = 0
+            result = None
+            while result is None or result[0] != 0:
+                max_steps += 1
+                self.assertLess(max_steps, 100)
+                options = ("--max-steps={0}".format(max_steps), "--dump-on-limit")
+                result = run_interpreter(source, *options)
+                rc, stdout, stderr = run_interpreter(source, "--optimize", *options)
+                # --optimize reports the number of fusions on the first line of the error output
+                fusions, stderr = stderr.split(b"\n", 1)
+                self.assertEqual(fusions, b"Applied fusions: 3")
+                self.assertEqual((rc, stdout, stderr), result, "--max-steps={0}".format(max_steps))
+            self.assertEqual(result[1], b"1234")
+
+
+class SharedStringTest(unittest.TestCase):
+    """
+    SETCHAR and CONCAT of a long string (StrBuf) change only the variable they set, not its copies
+    """
+
+    def test_copies_keep_their_value(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = write_program(tmp_dir, SHARED_STRING_PROGRAM)
+            rc, stdout, stderr = run_interpreter(source)
+        a = "a" * 255 + "b"
+        expected = ["ae" + a[2:], "c" + a[1:], a + "d"]
+        self.assertEqual((rc, stdout.decode("utf-8").split("\n"), stderr), (0, expected, b""))
+
+
+class CompileTest(unittest.TestCase):
+    """
+    --compile gives the same results as the default evaluation on the programs of the test corpus
+    and of the benchmarks
+    """
+
+    def test_same_results_on_corpus(self):
+        sources = sorted(glob.glob(os.path.join(REPO_DIR, "both", "interpret-only", "**", "*.src"), recursive=True))
+        sources += sorted(glob.glob(os.path.join(REPO_DIR, "benchmarks", "programs", "*.src")))
+        self.assertTrue(sources)
+        for source in sources:
+            input_path = source[:-len(".src")] + ".in"
+            if not os.path.exists(input_path):
+                input_path = os.devnull
+            with self.subTest(source=os.path.relpath(source, REPO_DIR)):
+                self.assertEqual(run_interpreter(source, "--compile", input_path=input_path),
+                                 run_interpreter(source, input_path=input_path))
+
+
+class CacheDirTest(unittest.TestCase):
+    """
+    --cache-dir stores checked programs and runs them from the cache until their source changes
+    """
+
+    def test_cached_program_same_and_edited_source_reloaded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = write_program(tmp_dir, COUNT_PROGRAM)
+            cache_dir = os.path.join(tmp_dir, "cache")
+            option = "--cache-dir=" + cache_dir
+            self.assertEqual(run_interpreter(source, option), (0, b"1234", b""))
+            cached = os.listdir(cache_dir)
+            self.assertEqual(len(cached), 1)
+            self.assertTrue(cached[0].endswith(".ippc"))
+            self.assertEqual(run_interpreter(source, option), (0, b"1234", b""))
+            self.assertEqual(os.listdir(cache_dir), cached)
+
+            write_program(tmp_dir, COUNT_PROGRAM.replace('type="int">5<', 'type="int">3<'))
+            self.assertEqual(run_interpreter(source, option), (0, b"12", b""))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+class DaemonTest(unittest.TestCase):
+    """
+    --daemon runs every job in its own interpreter state
+    """
+
+    def test_jobs_on_standard_input(self):
+        jobs = [{"id": 1, "source": ECHO_PROGRAM, "input": "a\nb\n"},
+                {"id": 2, "source": COUNT_PROGRAM},
+                {"id": 3, "source": "<program"},
+                {"id": 4, "source": ECHO_PROGRAM, "input": "c"}]
+        process = subprocess.run([sys.executable, INTERPRETER, "--daemon"], capture_output=True, timeout=60,
+                                 input="".join(json.dumps(job) + "\n" for job in jobs).encode("utf-8"))
+        self.assertEqual(process.returncode, 0)
+        results = [json.loads(line) for line in process.stdout.decode("utf-8").splitlines()]
+        self.assertEqual([(result["id"], result["rc"], result["stdout"]) for result in results],
+                         [(1, 0, "a\nb\n"), (2, 0, "1234"), (3, 31, ""), (4, 0, "c\n")])
+
+    def test_path_which_is_not_a_socket_is_kept(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("data")
+            process = subprocess.run([sys.executable, INTERPRETER, "--daemon=" + path],
+                                     stdin=subprocess.DEVNULL, capture_output=True, timeout=60)
+            self.assertEqual(process.returncode, 12)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "data")
+
+
+if __name__ == "__main__":
+    unittest.main()